@@ -1,4 +1,6 @@
-from fastapi import FastAPI
+from typing import Annotated
+
+from fastapi import FastAPI, Query
 from pydantic import BaseModel
 
 from drivematch.car import GroupedCarsByManufacturerAndModel, ScoredCar
@@ -6,7 +8,9 @@ from drivematch.core import create_default_drivematch_service
 
 # https://suchen.mobile.de/fahrzeuge/search.html?c=EstateCar&clim=AUTOMATIC_CLIMATISATION_2_ZONES&cn=DE&con=USED&dam=false&fe=CARPLAY&fe=DIGITAL_COCKPIT&fe=ELECTRIC_ADJUSTABLE_SEATS&fe=SPORT_PACKAGE&fr=2021%3A&ft=DIESEL&ft=PETROL&gn=68766%2C+Hockenheim%2C+Baden-Württemberg&isSearchRequest=true&ll=49.3261824%2C8.5186845&ml=%3A50000&od=down&p=%3A52000&pw=147%3A&rd=100&ref=srpHead&s=Car&sb=doc&tr=AUTOMATIC_GEAR&vc=Car
 
-drive_match_service = create_default_drivematch_service("./drivematch.db")
+drive_match_service = create_default_drivematch_service(
+    "./drivematch.db", concurrent=True
+)
 
 app = FastAPI()
 
@@ -31,6 +35,8 @@ def scores(
     preferred_age: float,
     filter_by_manufacturer: str,
     filter_by_model: str,
+    limit: Annotated[int | None, Query(ge=1)] = None,
+    offset: Annotated[int, Query(ge=0)] = 0,
 ) -> list[ScoredCar]:
     return drive_match_service.get_scores(
         search_id,
@@ -41,12 +47,14 @@ def scores(
         preferred_age,
         filter_by_manufacturer,
         filter_by_model,
+        limit=limit,
+        offset=offset,
     )
 
 
 @app.get("/api/v2/groups")
 def groups(search_id: str) -> list[GroupedCarsByManufacturerAndModel]:
-    return drive_match_service.get_groups(search_id)
+    return drive_match_service.get_groups(search_id, include_cars=False)
 
 
 @app.get("/api/v2/searches")
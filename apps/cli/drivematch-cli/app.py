@@ -130,6 +130,14 @@ def scores(  # noqa: PLR0913
             help="Preferred advertisement age of the car", min=0.0, max=17800.0
         ),
     ] = 0.0,
+    weight_deal: Annotated[
+        float,
+        typer.Option(
+            help="Weight of how far the price is below the depreciation curve",
+            min=-10.0,
+            max=10.0,
+        ),
+    ] = 0.0,
     filter_by_manufacturers: Annotated[
         list[str],
         typer.Option(
@@ -144,6 +152,27 @@ def scores(  # noqa: PLR0913
             "--filter-models", "-o", help="Filter inclusively by a particular model"
         ),
     ] = [],
+    filter_by_attributes: Annotated[
+        list[str],
+        typer.Option(
+            "--require-attributes", help="Only show cars with a particular attribute"
+        ),
+    ] = [],
+    limit: Annotated[
+        int | None,
+        typer.Option("--limit", "-n", help="Only show the best N cars", min=1),
+    ] = None,
+    offset: Annotated[
+        int,
+        typer.Option(help="Skip the best N cars before showing results", min=0),
+    ] = 0,
+    *,
+    normalize_over_filtered: Annotated[
+        bool,
+        typer.Option(
+            help="Normalize over the filtered cars instead of all cars of the search"
+        ),
+    ] = False,
 ) -> None:
     logger.info("Scoring cars for search with ID %s", search_id)
     logger.debug(
@@ -169,6 +198,11 @@ def scores(  # noqa: PLR0913
         preferred_advertisement_age,
         filter_by_manufacturers,
         filter_by_models,
+        limit,
+        offset,
+        normalize_over_filtered=normalize_over_filtered,
+        weight_deal=weight_deal,
+        filter_by_attributes=filter_by_attributes,
     )
     scores_table = Table(title=f"Scored Cars ({len(scored_cars)} cars)")
     scores_table.add_column("Manufacturer", justify="left", style="cyan")
@@ -201,9 +235,16 @@ def groups(
             help="The ID of the search (first unique characters are enough)",
         ),
     ],
+    *,
+    streaming: Annotated[
+        bool,
+        typer.Option(help="Read the search in batches instead of loading it at once"),
+    ] = False,
 ) -> None:
     logger.info("Showing groups for search with ID %s", search_id)
-    grouped_cars = drivematch_service.get_groups(search_id_matches(search_id))
+    grouped_cars = drivematch_service.get_groups(
+        search_id_matches(search_id), include_cars=False, streaming=streaming
+    )
     groups_table = Table(title=f"Grouped Cars ({len(grouped_cars)} groups)")
     groups_table.add_column("Manufacturer", justify="left", style="cyan")
     groups_table.add_column("Model", justify="left", style="magenta")
@@ -225,6 +266,196 @@ def groups(
     console.print(groups_table)
 
 
+@app.command(short_help="Show the price history of cars across all searches")
+def history(
+    car_ids: Annotated[
+        list[str],
+        typer.Option("--car-id", "-c", help="The ID of a car to show the history of"),
+    ],
+) -> None:
+    logger.info("Showing price history of %s", car_ids)
+    histories = drivematch_service.get_price_histories(car_ids)
+    history_table = Table(title=f"Price History ({len(histories)} cars)")
+    history_table.add_column("Car", justify="left", style="cyan")
+    history_table.add_column("Scraped", justify="center", style="green")
+    history_table.add_column("Price", justify="center", style="blue")
+    history_table.add_column("Mileage", justify="center", style="yellow")
+    history_table.add_column("Days on Market", justify="center", style="white")
+    for car, car_id in enumerate(histories.car_ids):
+        for row in range(histories.offsets[car], histories.offsets[car + 1]):
+            history_table.add_row(
+                car_id,
+                str(histories.timestamps[row].astype("datetime64[D]")),
+                str(histories.prices[row]),
+                str(histories.mileages[row]),
+                str(histories.days_on_market[car]),
+            )
+    console.print(history_table)
+
+
+@app.command(short_help="Show the market of a search name per scrape date")
+def trends(
+    name: Annotated[str, typer.Argument(help="The name of the searches")],
+) -> None:
+    logger.info("Showing market trends for search name %s", name)
+    market_trends = drivematch_service.get_market_trends(name)
+    trends_table = Table(title=f"Market Trends of {name}")
+    trends_table.add_column("Date", justify="center", style="yellow")
+    trends_table.add_column("Manufacturer", justify="left", style="cyan")
+    trends_table.add_column("Model", justify="left", style="magenta")
+    trends_table.add_column("Count", justify="center", style="white")
+    trends_table.add_column("Avg. Price", justify="center", style="blue")
+    trends_table.add_column("Median Price", justify="center", style="blue")
+    trends_table.add_column("Avg. Mileage", justify="center", style="green")
+    trends_table.add_column("Median Mileage", justify="center", style="green")
+    for trend in market_trends:
+        trends_table.add_row(
+            trend.scrape_date.isoformat(),
+            trend.manufacturer,
+            trend.model,
+            str(trend.count),
+            f"{trend.mean_price:.0f}",
+            f"{trend.median_price:.0f}",
+            f"{trend.mean_mileage:.0f}",
+            f"{trend.median_mileage:.0f}",
+        )
+    console.print(trends_table)
+
+
+@app.command(short_help="Show the cars most similar to the given cars")
+def similar(
+    car_ids: Annotated[
+        list[str],
+        typer.Option("--car-id", "-c", help="The ID of a car to find similar cars for"),
+    ],
+    search_id: Annotated[
+        str | None,
+        typer.Option(
+            "--search-id",
+            "-s",
+            help="The ID of the search (first unique characters are enough), all searches if omitted",
+        ),
+    ] = None,
+    k: Annotated[
+        int, typer.Option("--count", "-k", help="How many similar cars to show", min=1)
+    ] = 10,
+) -> None:
+    logger.info("Showing cars similar to %s", car_ids)
+    similar_cars = drivematch_service.get_similar_cars(
+        search_id_matches(search_id) if search_id is not None else None, car_ids, k
+    )
+    for car_id, neighbours in zip(car_ids, similar_cars, strict=True):
+        similar_table = Table(title=f"Similar to {car_id} ({len(neighbours)} cars)")
+        similar_table.add_column("Manufacturer", justify="left", style="cyan")
+        similar_table.add_column("Model", justify="left", style="magenta")
+        similar_table.add_column("Distance", justify="center", style="white")
+        similar_table.add_column("Price", justify="center", style="blue")
+        similar_table.add_column("First Registration", justify="center", style="green")
+        similar_table.add_column("Horse Power", justify="center", style="red")
+        similar_table.add_column("Mileage", justify="center", style="yellow")
+        similar_table.add_column("Link", justify="center", style="white")
+        for neighbour in neighbours:
+            similar_table.add_row(
+                neighbour.car.manufacturer,
+                neighbour.car.model,
+                f"{neighbour.distance:.3f}",
+                str(neighbour.car.price),
+                neighbour.car.first_registration.strftime("%Y-%m-%d"),
+                str(neighbour.car.horse_power),
+                str(neighbour.car.mileage),
+                f"[link={neighbour.car.details_url}]Link[/link]",
+            )
+        console.print(similar_table)
+
+
+@app.command(short_help="Show p10, median and p90 per group across searches")
+def quantiles(
+    search_ids: Annotated[
+        list[str],
+        typer.Option(
+            "--search-id",
+            "-s",
+            help="The IDs of the searches (first unique characters are enough)",
+        ),
+    ],
+) -> None:
+    logger.info("Showing quantiles for searches with IDs %s", search_ids)
+    grouped_quantiles = drivematch_service.get_group_quantiles(
+        [search_id_matches(search_id) for search_id in search_ids]
+    )
+    quantiles_table = Table(
+        title=f"Quantiles p10 / p50 / p90 ({len(grouped_quantiles)} groups)"
+    )
+    quantiles_table.add_column("Manufacturer", justify="left", style="cyan")
+    quantiles_table.add_column("Model", justify="left", style="magenta")
+    quantiles_table.add_column("Count", justify="center", style="white")
+    quantiles_table.add_column("Price", justify="center", style="blue")
+    quantiles_table.add_column("Age", justify="center", style="green")
+    quantiles_table.add_column("Mileage", justify="center", style="yellow")
+    for group in grouped_quantiles:
+        quantiles_table.add_row(
+            group.manufacturer,
+            group.model,
+            str(group.count),
+            " / ".join(f"{price:.0f}" for price in group.price_quantiles),
+            " / ".join(f"{age:.0f}" for age in group.age_quantiles),
+            " / ".join(f"{mileage:.0f}" for mileage in group.mileage_quantiles),
+        )
+    console.print(quantiles_table)
+
+
+@app.command(
+    short_help="Show the cars of a search no other car beats on horse power, price, mileage and age"
+)
+def pareto(
+    search_id: Annotated[
+        str,
+        typer.Option(
+            "--search-id",
+            "-s",
+            help="The ID of the search (first unique characters are enough)",
+        ),
+    ],
+    filter_by_manufacturers: Annotated[
+        list[str],
+        typer.Option(
+            "--filter-manufacturers",
+            "-m",
+            help="Filter inclusively by a particular manufacturer",
+        ),
+    ] = [],
+    filter_by_models: Annotated[
+        list[str],
+        typer.Option(
+            "--filter-models", "-o", help="Filter inclusively by a particular model"
+        ),
+    ] = [],
+) -> None:
+    logger.info("Showing pareto front for search with ID %s", search_id)
+    cars = drivematch_service.get_pareto_front(
+        search_id_matches(search_id), filter_by_manufacturers, filter_by_models
+    )
+    pareto_table = Table(title=f"Pareto Front ({len(cars)} cars)")
+    pareto_table.add_column("Manufacturer", justify="left", style="cyan")
+    pareto_table.add_column("Model", justify="left", style="magenta")
+    pareto_table.add_column("Price", justify="center", style="blue")
+    pareto_table.add_column("First Registration", justify="center", style="green")
+    pareto_table.add_column("Horse Power", justify="center", style="red")
+    pareto_table.add_column("Mileage", justify="center", style="yellow")
+    pareto_table.add_column("Link", justify="center", style="white")
+    for car in cars:
+        pareto_table.add_row(
+            car.manufacturer,
+            car.model,
+            str(car.price),
+            car.first_registration.strftime("%Y-%m-%d"),
+            str(car.horse_power),
+            str(car.mileage),
+            f"[link={car.details_url}]Link[/link]",
+        )
+    console.print(pareto_table)
+
+
 @app.callback()
 def main(
     db_path: Annotated[
@@ -21,6 +21,8 @@ from drivematch.types import ScoredCar
 
 logger = logging.getLogger(__name__)
 
+SCORED_CARS_TABLE_LIMIT = 1000
+
 
 class DriveMatchDialog(QDialog):
     drivematch_service: DriveMatchService
@@ -94,7 +96,8 @@ class DriveMatchDialog(QDialog):
         self.analyze_widget.set_searches(searches)
 
     def __set_scored_cars(self) -> None:
-        scored_cars = self.__get_scored_cars()
+        # Weight changes only redraw the table, so only its rows are ranked.
+        scored_cars = self.__get_scored_cars(limit=SCORED_CARS_TABLE_LIMIT)
         self.analyze_widget.set_scored_cars(scored_cars)
 
     def __set_grouped_cars(self) -> None:
@@ -103,19 +106,21 @@ class DriveMatchDialog(QDialog):
             logger.info("Got invalid selected search: %s", selected_search_id)
             show_error_message("Please select a search.")
             return
-        grouped_cars = self.drivematch_service.get_groups(selected_search_id)
+        grouped_cars = self.drivematch_service.get_groups(
+            selected_search_id, include_cars=False
+        )
         self.analyze_widget.set_grouped_cars(grouped_cars)
 
     def __set_scored_cars_and_regression_line(self) -> None:
         selected_search_id = self.analyze_widget.get_selected_search_id()
         scored_cars = self.__get_scored_cars()
-        self.analyze_widget.set_scored_cars(scored_cars)
+        self.analyze_widget.set_scored_cars(scored_cars[:SCORED_CARS_TABLE_LIMIT])
         regression_line = self.drivematch_service.get_regression_line(
                 selected_search_id, self.analyze_widget.get_function_type()
         )
         self.analyze_widget.set_regression_line(scored_cars, regression_line)
 
-    def __get_scored_cars(self) -> list[ScoredCar]:
+    def __get_scored_cars(self, limit: int | None = None) -> list[ScoredCar]:
         selected_search_id = self.analyze_widget.get_selected_search_id()
         if selected_search_id is None:
             logger.info("Got invalid selected search: %s", selected_search_id)
@@ -125,6 +130,7 @@ class DriveMatchDialog(QDialog):
         return self.drivematch_service.get_scores(
             selected_search_id,
             **search_parameters,
+            limit=limit,
         )
 
 
@@ -1,72 +1,357 @@
-from collections import defaultdict
 import datetime
-from collections.abc import Callable
+from collections.abc import Iterable
 
 import numpy as np
-import scipy.optimize
 
+from drivematch._internal import regression
+from drivematch._internal.similarity import SimilarityIndex
+from drivematch._internal.sketches import QuantileSketch
 from drivematch.types import (
+    EPOCH_ORDINAL,
+    BatchScores,
+    BinnedRegressionDeviation,
     Car,
+    CarFrame,
+    DealCar,
     GroupedCarsByManufacturerAndModel,
+    GroupedQuantiles,
+    GroupedRegressionLine,
     RegressionFunctionType,
+    RegressionModelFit,
+    RegressionParameters,
     ScoredCar,
+    SimilarCar,
+    epoch_day,
 )
 
+
 def normalize(
-    value: float, min_value: float, max_value: float, epsilon: float = 1e-10
-) -> float:
+    value: float | np.ndarray,
+    min_value: float,
+    max_value: float,
+    epsilon: float = 1e-10,
+) -> float | np.ndarray:
     if min_value == max_value:
-        return 1.0
+        return np.ones_like(value, dtype=np.float64) if np.ndim(value) else 1.0
     return (value - min_value + epsilon) / (max_value - min_value + epsilon)
 
 
+def select_top(scores: np.ndarray, amount: int) -> np.ndarray:
+    # Indices of the `amount` highest scores in the order of a stable
+    # descending sort. np.partition finds the cut-off score in O(N); everything
+    # tied with it stays a candidate so ties resolve by index like a full sort.
+    if amount >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    if amount <= 0:
+        return np.empty(0, dtype=np.intp)
+    threshold = np.partition(scores, len(scores) - amount)[len(scores) - amount]
+    candidates = np.flatnonzero(scores >= threshold)
+    order = np.argsort(-scores[candidates], kind="stable")
+    return candidates[order[:amount]]
+
+
+SKYLINE_CHUNK_SIZE = 32
+
+
+def pareto_front(objectives: np.ndarray, block_size: int = 1024) -> np.ndarray:
+    # Indices of the rows of `objectives` (one column per objective, lower is
+    # better) that no other row dominates. Sort-filter-skyline: after sorting
+    # by the sum of the normalized objectives, with ties broken
+    # lexicographically, a row can only be dominated by rows before it. Rows
+    # are then checked block by block against the skyline found so far and
+    # against the rest of their block, all as array comparisons.
+    objectives = np.asarray(objectives, dtype=np.float64)
+    if len(objectives) == 0:
+        return np.empty(0, dtype=np.intp)
+
+    minimums = objectives.min(axis=0)
+    ranges = objectives.max(axis=0) - minimums
+    normalized = (objectives - minimums) / np.where(ranges > 0, ranges, 1)
+    order = np.lexsort((*objectives.T[::-1], normalized.sum(axis=1)))
+    points = objectives[order]
+
+    skyline = np.empty((0, objectives.shape[1]))
+    skyline_positions = []
+    for start in range(0, len(points), block_size):
+        block = points[start : start + block_size]
+        positions = np.arange(start, start + len(block))
+        # The earliest skyline rows dominate most of what follows, so checking
+        # against the skyline in small chunks shrinks the block quickly.
+        for skyline_start in range(0, len(skyline), SKYLINE_CHUNK_SIZE):
+            survivors = ~_dominated_by_any(
+                block, skyline[skyline_start : skyline_start + SKYLINE_CHUNK_SIZE]
+            )
+            block, positions = block[survivors], positions[survivors]
+        survivors = ~_dominated_by_any(block, block)
+        skyline = np.concatenate((skyline, block[survivors]))
+        skyline_positions.append(positions[survivors])
+
+    return np.sort(order[np.concatenate(skyline_positions)])
+
+
+def _dominated_by_any(points: np.ndarray, others: np.ndarray) -> np.ndarray:
+    # Whether each point is dominated by at least one of the others: no worse
+    # in every objective and better in at least one. Compared one objective at
+    # a time, as reducing over a short trailing axis is slow.
+    no_worse = np.ones((len(points), len(others)), dtype=np.bool_)
+    better = np.zeros_like(no_worse)
+    for objective in range(points.shape[1]):
+        point_values = points[:, objective, np.newaxis]
+        other_values = others[np.newaxis, :, objective]
+        no_worse &= other_values <= point_values
+        better |= other_values < point_values
+    return np.any(no_worse & better, axis=1)
+
+
+class StreamingGroupStatistics:
+    # Running count, mean and variance of price, mileage, horse power, age
+    # and advertisement age per (manufacturer, model), fed one CarFrame at a
+    # time. Every batch is summarized per group with np.bincount and merged
+    # into the totals with Chan's parallel update of Welford's algorithm, so
+    # memory only grows with the number of groups.
+    FEATURES = 5
+
+    def __init__(self, today: int) -> None:
+        self.today = today
+        self.group_ids: dict[tuple[str, str], int] = {}
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.means = np.zeros((self.FEATURES, 0))
+        self.squared_deviations = np.zeros((self.FEATURES, 0))
+
+    def add(self, frame: CarFrame) -> None:
+        if len(frame) == 0:
+            return
+        groups = self._group_codes(frame)
+        group_count = len(self.group_ids)
+        values = np.stack(
+            [
+                frame.prices,
+                frame.mileages,
+                frame.horse_powers,
+                self.today - frame.first_registration_days,
+                self.today - frame.advertised_since_days,
+            ]
+        ).astype(np.float64)
+
+        batch_counts = np.bincount(groups, minlength=group_count)
+        present = batch_counts > 0
+        batch_means = np.zeros((self.FEATURES, group_count))
+        batch_squared_deviations = np.zeros((self.FEATURES, group_count))
+        for feature, feature_values in enumerate(values):
+            sums = np.bincount(groups, weights=feature_values, minlength=group_count)
+            batch_means[feature, present] = sums[present] / batch_counts[present]
+            deviations = feature_values - batch_means[feature, groups]
+            batch_squared_deviations[feature] = np.bincount(
+                groups, weights=deviations**2, minlength=group_count
+            )
+
+        self._grow(group_count)
+        counts = self.counts + batch_counts
+        delta = batch_means - self.means
+        weight = np.divide(
+            batch_counts, counts, out=np.zeros(group_count), where=counts > 0
+        )
+        self.means = self.means + delta * weight
+        self.squared_deviations = (
+            self.squared_deviations
+            + batch_squared_deviations
+            + delta**2 * self.counts * weight
+        )
+        self.counts = counts
+
+    def _group_codes(self, frame: CarFrame) -> np.ndarray:
+        # Maps the groups of this frame to the group ids of the stream,
+        # numbering new groups in order of first appearance.
+        group_codes, group_keys = frame.group_codes()
+        group_ids = np.array(
+            [self.group_ids.setdefault(key, len(self.group_ids)) for key in group_keys],
+            dtype=np.int64,
+        )
+        return group_ids[group_codes]
+
+    def _grow(self, group_count: int) -> None:
+        missing = group_count - len(self.counts)
+        if missing > 0:
+            self.counts = np.concatenate((self.counts, np.zeros(missing, np.int64)))
+            padding = np.zeros((self.FEATURES, missing))
+            self.means = np.hstack((self.means, padding))
+            self.squared_deviations = np.hstack((self.squared_deviations, padding))
+
+    def variances(self) -> np.ndarray:
+        # Population variances, one row per feature and one column per group.
+        return np.divide(
+            self.squared_deviations,
+            self.counts,
+            out=np.zeros_like(self.squared_deviations),
+            where=self.counts > 0,
+        )
+
+    def grouped_cars(self) -> list[GroupedCarsByManufacturerAndModel]:
+        means = self.means.tolist()
+        grouped_cars = [
+            GroupedCarsByManufacturerAndModel(
+                manufacturer=manufacturer,
+                model=model,
+                count=int(self.counts[group]),
+                average_price=means[0][group],
+                average_mileage=means[1][group],
+                average_horse_power=means[2][group],
+                average_age=means[3][group],
+                average_advertisement_age=means[4][group],
+                cars=[],
+            )
+            for (manufacturer, model), group in self.group_ids.items()
+        ]
+        grouped_cars.sort(key=lambda x: x.count, reverse=True)
+        return grouped_cars
+
+
 class CarsAnalyzer:
-    def __init__(self, cars: list[Car] = []) -> None:
+    def __init__(self, cars: list[Car] | CarFrame = []) -> None:
+        self.as_of: datetime.date | None = None
         self.set_cars(cars)
 
-    def set_cars(self, cars: list[Car]) -> None:
+    def set_cars(self, cars: list[Car] | CarFrame) -> None:
         self.cars = cars
+        self.frame = cars if isinstance(cars, CarFrame) else CarFrame.from_cars(cars)
+        self.horse_powers = self.frame.horse_powers
+        self.prices = self.frame.prices
+        self.mileages = self.frame.mileages
+        self.first_registration_days = self.frame.first_registration_days
+        self.advertised_since_days = self.frame.advertised_since_days
+        self.lowercase_manufacturers = [m.lower() for m in self.frame.manufacturers]
+        self.lowercase_models = [m.lower() for m in self.frame.models]
+        self.feature_matrix: np.ndarray | None = None
+        self.feature_matrix_key: tuple | None = None
+        self.deal_feature: np.ndarray | None = None
+        self.deal_feature_key: tuple | None = None
+        self.similarity_index: SimilarityIndex | None = None
+        self.similarity_index_day: int | None = None
+        self.row_of_id: dict[str, int] = {}
+
+    def _cars_at(self, indices: list[int] | np.ndarray) -> list[Car]:
+        if isinstance(self.cars, CarFrame):
+            return self.cars.to_cars(indices)
+        return [self.cars[index] for index in indices]
+
+    def set_as_of(self, as_of: datetime.date | None) -> None:
+        # Ages are whole days up to this day. Without one, every request reads
+        # the current date once and uses it throughout.
+        self.as_of = as_of
+
+    def _today(self) -> int:
+        return epoch_day(self.as_of or datetime.datetime.now().date())
+
+    @staticmethod
+    def _start_of_day(day: int) -> datetime.datetime:
+        return datetime.datetime.fromordinal(day + EPOCH_ORDINAL)
+
+    def get_grouped_cars(
+        self, *, include_cars: bool = True
+    ) -> list[GroupedCarsByManufacturerAndModel]:
+        group_codes, group_keys = self.frame.group_codes()
+        group_count = len(group_keys)
+        if group_count == 0:
+            return []
+
+        today = self._today()
+        counts = np.bincount(group_codes, minlength=group_count)
+        members = np.argsort(group_codes, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        def averages(values: np.ndarray) -> list[float]:
+            return (np.add.reduceat(values[members], starts) / counts).tolist()
+
+        average_prices = averages(self.prices)
+        average_mileages = averages(self.mileages)
+        average_horse_powers = averages(self.horse_powers)
+        average_ages = averages(today - self.first_registration_days)
+        average_advertisement_ages = averages(today - self.advertised_since_days)
+        group_members = np.split(members, starts[1:])
+
+        grouped_cars = [
+            GroupedCarsByManufacturerAndModel(
+                manufacturer=manufacturer,
+                model=model,
+                count=int(counts[group]),
+                average_price=average_prices[group],
+                average_mileage=average_mileages[group],
+                average_horse_power=average_horse_powers[group],
+                average_age=average_ages[group],
+                average_advertisement_age=average_advertisement_ages[group],
+                cars=self._cars_at(group_members[group]) if include_cars else [],
+            )
+            for group, (manufacturer, model) in enumerate(group_keys)
+        ]
 
-    def get_grouped_cars(self) -> list[GroupedCarsByManufacturerAndModel]:
-        groups: dict[tuple[str, str], list[Car]] = defaultdict(list)
-        for car in self.cars:
-            groups[(car.manufacturer, car.model)].append(car)
+        grouped_cars.sort(key=lambda x: x.count, reverse=True)
+        return grouped_cars
 
-        now = datetime.datetime.now()
-        grouped_cars: list[GroupedCarsByManufacturerAndModel] = []
+    def get_streamed_grouped_cars(
+        self, frames: Iterable[CarFrame]
+    ) -> list[GroupedCarsByManufacturerAndModel]:
+        # Same groups as get_grouped_cars, without cars, from batches of a
+        # search that never have to be in memory at once.
+        statistics = StreamingGroupStatistics(self._today())
+        for frame in frames:
+            statistics.add(frame)
+        return statistics.grouped_cars()
 
-        for (manufacturer, model), group in groups.items():
-            count = len(group)
+    def get_quantile_sketches(
+        self,
+    ) -> dict[tuple[str, str], dict[str, QuantileSketch]]:
+        # Price, mileage and registration day sketches per group. Ages are
+        # left out as they change every day; they follow from the
+        # registration days when the sketches are summarized.
+        group_codes, group_keys = self.frame.group_codes()
+        if len(group_keys) == 0:
+            return {}
 
-            total_price = 0
-            total_mileage = 0
-            total_hp = 0
-            total_age = 0
-            total_ad_age = 0
+        members = np.argsort(group_codes, kind="stable")
+        boundaries = np.cumsum(np.bincount(group_codes))[:-1]
+        columns = {
+            "price": self.prices,
+            "mileage": self.mileages,
+            "first_registration_day": self.first_registration_days,
+        }
 
-            for car in group:
-                total_price += car.price
-                total_mileage += car.mileage
-                total_hp += car.horse_power
-                total_age += (now - car.first_registration).days
-                total_ad_age += (now - car.advertised_since).days
+        sketches: dict[tuple[str, str], dict[str, QuantileSketch]] = {
+            key: {} for key in group_keys
+        }
+        for metric, values in columns.items():
+            group_values = np.split(values[members], boundaries)
+            for key, values_of_group in zip(group_keys, group_values, strict=True):
+                sketches[key][metric] = QuantileSketch()
+                sketches[key][metric].add(values_of_group)
+        return sketches
 
-            grouped_cars.append(
-                GroupedCarsByManufacturerAndModel(
+    def summarize_quantile_sketches(
+        self,
+        sketches: dict[tuple[str, str], dict[str, QuantileSketch]],
+        quantiles: list[float] = [0.1, 0.5, 0.9],
+    ) -> list[GroupedQuantiles]:
+        today = self._today()
+        grouped_quantiles = []
+        for (manufacturer, model), metric_sketches in sketches.items():
+            # The q-quantile of the age is the (1 - q)-quantile of the
+            # registration day counted back from today.
+            registration_days = metric_sketches["first_registration_day"].quantiles(
+                [1 - quantile for quantile in quantiles]
+            )
+            grouped_quantiles.append(
+                GroupedQuantiles(
                     manufacturer=manufacturer,
                     model=model,
-                    count=count,
-                    average_price=total_price / count,
-                    average_mileage=total_mileage / count,
-                    average_horse_power=total_hp / count,
-                    average_age=total_age / count,
-                    average_advertisement_age=total_ad_age / count,
-                    cars=group,
+                    count=metric_sketches["price"].count,
+                    quantiles=list(quantiles),
+                    price_quantiles=metric_sketches["price"].quantiles(quantiles),
+                    mileage_quantiles=metric_sketches["mileage"].quantiles(quantiles),
+                    age_quantiles=[today - day for day in registration_days],
                 )
             )
 
-        grouped_cars.sort(key=lambda x: x.count, reverse=True)
-        return grouped_cars
+        grouped_quantiles.sort(key=lambda x: x.count, reverse=True)
+        return grouped_quantiles
 
     def set_weights_and_filters(  # noqa: PLR0913
         self,
@@ -79,6 +364,11 @@ class CarsAnalyzer:
         preferred_advertisement_age: float,
         filter_by_manufacturers: list[str],
         filter_by_models: list[str],
+        *,
+        normalize_over_filtered: bool = False,
+        weight_deal: float = 0.0,
+        deal_function_type: RegressionFunctionType = RegressionFunctionType.EXPONENTIAL,
+        filter_by_attributes: list[str] = [],
     ) -> None:
         self.weight_hp = weight_hp
         self.weight_price = weight_price
@@ -89,58 +379,257 @@ class CarsAnalyzer:
         self.preferred_advertisement_age = preferred_advertisement_age
         self.filter_by_manufacturers = filter_by_manufacturers
         self.filter_by_models = filter_by_models
+        self.filter_by_attributes = filter_by_attributes
+        self.normalize_over_filtered = normalize_over_filtered
+        self.weight_deal = weight_deal
+        self.deal_function_type = deal_function_type
+        self.scoring_day = self._today()
 
-    def get_scored_cars(self) -> list[ScoredCar]:
+    def get_scored_cars(
+        self, limit: int | None = None, offset: int = 0
+    ) -> list[ScoredCar]:
         if self.cars is None or len(self.cars) == 0:
             return []
 
-        self.min_hp = min(car.horse_power for car in self.cars)
-        self.max_hp = max(car.horse_power for car in self.cars)
-        self.min_price = min(car.price for car in self.cars)
-        self.max_price = max(car.price for car in self.cars)
-        self.min_mileage = min(car.mileage for car in self.cars)
-        self.max_mileage = max(car.mileage for car in self.cars)
+        # Filters are evaluated on the category codes first, so cars that are
+        # filtered out are never scored or sorted.
+        candidates = np.flatnonzero(
+            self._filter_mask(
+                self.filter_by_manufacturers,
+                self.filter_by_models,
+                self.filter_by_attributes,
+            )
+        )
+        if len(candidates) == 0:
+            return []
+
+        scores = self._weighted_sum(self._feature_matrix(candidates))
+        if self.weight_deal != 0:
+            scores = scores + self._deal_feature(candidates) * self.weight_deal
+        amount = len(candidates) if limit is None else offset + limit
+        order = select_top(scores, amount)[offset:]
 
-        now = datetime.datetime.now()
+        return [
+            ScoredCar(car=car, score=score)
+            for car, score in zip(
+                self._cars_at(candidates[order]),
+                scores[order].tolist(),
+                strict=True,
+            )
+        ]
 
-        self.min_age = min(
-            (now - car.first_registration).days for car in self.cars
+    def get_batch_scores(
+        self,
+        weight_matrix: np.ndarray,
+        top_k: int | None = None,
+        max_chunk_size: int = 2**22,
+    ) -> BatchScores:
+        # Scores the filtered cars under every row of weight_matrix, whose
+        # columns follow the weight order of set_weights_and_filters, with an
+        # optional sixth column for the deal weight. The weights given there
+        # are ignored; preferred ages, filters and the deal model apply.
+        # Score matrices are computed for as many weight vectors at a time as
+        # fit into max_chunk_size scores.
+        weight_matrix = np.atleast_2d(np.asarray(weight_matrix, dtype=np.float64))
+        candidates = np.flatnonzero(
+            self._filter_mask(
+                self.filter_by_manufacturers,
+                self.filter_by_models,
+                self.filter_by_attributes,
+            )
         )
-        self.max_age = max(
-            (now - car.first_registration).days for car in self.cars
+        car_ids = [self.frame.ids[index] for index in candidates.tolist()]
+        vector_count = len(weight_matrix)
+        if len(candidates) == 0:
+            return BatchScores(car_ids=car_ids, ranks=np.empty((vector_count, 0)))
+
+        features = self._feature_matrix(candidates)
+        if weight_matrix.shape[1] == len(features) + 1:
+            features = np.vstack((features, self._deal_feature(candidates)))
+        chunk_size = max(1, max_chunk_size // len(candidates))
+
+        if top_k is None:
+            ranks = np.empty((vector_count, len(candidates)), dtype=np.int32)
+            rank_values = np.arange(len(candidates), dtype=np.int32)
+            for start in range(0, vector_count, chunk_size):
+                scores = weight_matrix[start : start + chunk_size] @ features
+                order = np.argsort(-scores, axis=1, kind="stable")
+                np.put_along_axis(
+                    ranks[start : start + chunk_size],
+                    order,
+                    rank_values[np.newaxis, :],
+                    axis=1,
+                )
+            return BatchScores(car_ids=car_ids, ranks=ranks)
+
+        amount = min(top_k, len(candidates))
+        top_indices = np.empty((vector_count, amount), dtype=np.intp)
+        top_scores = np.empty((vector_count, amount))
+        for start in range(0, vector_count, chunk_size):
+            scores = weight_matrix[start : start + chunk_size] @ features
+            for row, row_scores in enumerate(scores, start):
+                top_indices[row] = select_top(row_scores, amount)
+                top_scores[row] = row_scores[top_indices[row]]
+        return BatchScores(
+            car_ids=car_ids, top_indices=top_indices, top_scores=top_scores
         )
-        self.min_advertisement_age = min(
-            (now - car.advertised_since).days for car in self.cars
+
+    def _weights(self) -> np.ndarray:
+        return np.array(
+            [
+                self.weight_hp,
+                self.weight_price,
+                self.weight_mileage,
+                self.weight_age,
+                self.weight_advertisement_age,
+            ]
         )
-        self.max_advertisement_age = max(
-            (now - car.advertised_since).days for car in self.cars
+
+    def _weighted_sum(self, features: np.ndarray) -> np.ndarray:
+        # features @ weights, accumulated one feature at a time so the scores
+        # are bit-identical to score().
+        weights = self._weights()
+        scores = features[0] * weights[0]
+        for feature, weight in zip(features[1:], weights[1:], strict=True):
+            scores = scores + feature * weight
+        return scores
+
+    def _feature_matrix(self, candidates: np.ndarray) -> np.ndarray:
+        # Normalized features of the candidates, one row per feature. The
+        # matrix only depends on the preferred ages and on the cars min/max
+        # are taken over, so weight changes reuse the cached matrix.
+        key = (
+            self.scoring_day,
+            self.preferred_age,
+            self.preferred_advertisement_age,
+            self._bounds_filters(),
         )
+        if key != self.feature_matrix_key:
+            rows = candidates if self.normalize_over_filtered else slice(None)
+            self.feature_matrix = self._normalized_features(rows)
+            self.feature_matrix_key = key
 
-        scored_cars = [ScoredCar(car=car, score=self.score(car)) for car in self.cars]
-        scored_cars = sorted(scored_cars, key=lambda x: x.score, reverse=True)
-        if len(self.filter_by_manufacturers) > 0:
-            scored_cars = [
-                scored_car
-                for scored_car in scored_cars
-                if scored_car.car.manufacturer.lower()
-                in [m.lower() for m in self.filter_by_manufacturers]
-            ]
-        if len(self.filter_by_models) > 0:
-            scored_cars = [
-                scored_car
-                for scored_car in scored_cars
-                if scored_car.car.model.lower()
-                in [m.lower() for m in self.filter_by_models]
+        if self.normalize_over_filtered or len(candidates) == len(self.frame):
+            return self.feature_matrix
+        return self.feature_matrix[:, candidates]
+
+    def _deal_feature(self, candidates: np.ndarray) -> np.ndarray:
+        # How far below the depreciation curve each candidate is priced, as a
+        # normalized row next to the feature matrix. The curve is fitted to
+        # the same cars the features are normalized over and cached the same
+        # way, so only a different model or normalization scope refits it.
+        key = (self.scoring_day, self.deal_function_type, self._bounds_filters())
+        if key != self.deal_feature_key:
+            rows = (
+                candidates
+                if self.normalize_over_filtered
+                else np.arange(len(self.frame))
+            )
+            _, z_scores = self._price_deviations(
+                self.deal_function_type, rows, self.scoring_day
+            )
+            deal_scores = -z_scores
+            self.deal_feature = normalize(
+                deal_scores, deal_scores.min().item(), deal_scores.max().item()
+            )
+            self.deal_feature_key = key
+
+        if self.normalize_over_filtered or len(candidates) == len(self.frame):
+            return self.deal_feature
+        return self.deal_feature[candidates]
+
+    def _bounds_filters(self) -> tuple | None:
+        # The filters that decide which cars min/max are taken over.
+        if not self.normalize_over_filtered:
+            return None
+        return (
+            tuple(self.filter_by_manufacturers),
+            tuple(self.filter_by_models),
+            tuple(self.filter_by_attributes),
+        )
+
+    def _normalized_features(self, rows: np.ndarray | slice) -> np.ndarray:
+        horse_powers = self.horse_powers[rows]
+        prices = self.prices[rows]
+        mileages = self.mileages[rows]
+        ages = self.scoring_day - self.first_registration_days[rows]
+        advertisement_ages = self.scoring_day - self.advertised_since_days[rows]
+        self._set_bounds(horse_powers, prices, mileages, ages, advertisement_ages)
+
+        return np.stack(
+            [
+                normalize(horse_powers, self.min_hp, self.max_hp),
+                normalize(prices, self.min_price, self.max_price),
+                normalize(mileages, self.min_mileage, self.max_mileage),
+                normalize(
+                    np.abs(ages - self.preferred_age), self.min_age, self.max_age
+                ),
+                normalize(
+                    np.abs(advertisement_ages - self.preferred_advertisement_age),
+                    self.min_advertisement_age,
+                    self.max_advertisement_age,
+                ),
             ]
-        return scored_cars
+        )
 
-    def score(self, car: Car) -> float:
-        now = datetime.datetime.now()
+    def _set_bounds(
+        self,
+        horse_powers: np.ndarray,
+        prices: np.ndarray,
+        mileages: np.ndarray,
+        ages: np.ndarray,
+        advertisement_ages: np.ndarray,
+    ) -> None:
+        self.min_hp = horse_powers.min().item()
+        self.max_hp = horse_powers.max().item()
+        self.min_price = prices.min().item()
+        self.max_price = prices.max().item()
+        self.min_mileage = mileages.min().item()
+        self.max_mileage = mileages.max().item()
+        self.min_age = ages.min().item()
+        self.max_age = ages.max().item()
+        self.min_advertisement_age = advertisement_ages.min().item()
+        self.max_advertisement_age = advertisement_ages.max().item()
 
-        age = (now - car.first_registration).days
+    def _filter_mask(
+        self,
+        filter_by_manufacturers: list[str],
+        filter_by_models: list[str],
+        filter_by_attributes: list[str] = [],
+    ) -> np.ndarray:
+        mask = np.ones(len(self.frame), dtype=np.bool_)
+        if len(filter_by_manufacturers) > 0:
+            mask &= self._category_mask(
+                self.frame.manufacturer_codes,
+                self.lowercase_manufacturers,
+                filter_by_manufacturers,
+            )
+        if len(filter_by_models) > 0:
+            mask &= self._category_mask(
+                self.frame.model_codes,
+                self.lowercase_models,
+                filter_by_models,
+            )
+        if len(filter_by_attributes) > 0:
+            mask &= self.frame.attribute_mask(filter_by_attributes)
+        return mask
+
+    @staticmethod
+    def _category_mask(
+        codes: np.ndarray, lowercase_categories: list[str], wanted: list[str]
+    ) -> np.ndarray:
+        wanted_lowercase = {value.lower() for value in wanted}
+        selected_categories = np.array(
+            [category in wanted_lowercase for category in lowercase_categories],
+            dtype=np.bool_,
+        )
+        return selected_categories[codes]
+
+    def score(self, car: Car) -> float:
+        age = self.scoring_day - epoch_day(car.first_registration)
         age = abs(age - self.preferred_age)
 
-        advertisement_age = (now - car.advertised_since).days
+        advertisement_age = self.scoring_day - epoch_day(car.advertised_since)
         advertisement_age = abs(
             advertisement_age - self.preferred_advertisement_age,
         )
@@ -167,31 +656,295 @@ class CarsAnalyzer:
             + (normalized_advertisement_age * self.weight_advertisement_age)
         )
 
+    def get_pareto_front(
+        self,
+        filter_by_manufacturers: list[str] = [],
+        filter_by_models: list[str] = [],
+    ) -> list[Car]:
+        # Cars no other car beats on horse power, price, mileage and age at
+        # once, cheapest first.
+        candidates = np.flatnonzero(
+            self._filter_mask(filter_by_manufacturers, filter_by_models)
+        )
+        ages = self._today() - self.first_registration_days[candidates]
+        objectives = np.column_stack(
+            (
+                -self.horse_powers[candidates],
+                self.prices[candidates],
+                self.mileages[candidates],
+                ages,
+            )
+        )
+        front = candidates[pareto_front(objectives)]
+        front = front[np.argsort(self.prices[front], kind="stable")]
+        return self._cars_at(front)
+
+    def get_deals(
+        self,
+        function_type: RegressionFunctionType,
+        threshold: float = 2.0,
+        filter_by_manufacturers: list[str] = [],
+        filter_by_models: list[str] = [],
+    ) -> list[DealCar]:
+        # Cars whose price is at least `threshold` robust standard deviations
+        # below the curve fitted to the filtered cars, best deal first.
+        candidates = np.flatnonzero(
+            self._filter_mask(filter_by_manufacturers, filter_by_models)
+        )
+        expected_prices, z_scores = self._price_deviations(
+            function_type, candidates, self._today()
+        )
+        deals = np.flatnonzero(z_scores <= -threshold)
+        deals = deals[np.argsort(z_scores[deals], kind="stable")]
+        residuals = self.prices[candidates[deals]] - expected_prices[deals]
+
+        return [
+            DealCar(
+                car=car,
+                expected_price=expected_price,
+                residual=residual,
+                z_score=z_score,
+            )
+            for car, expected_price, residual, z_score in zip(
+                self._cars_at(candidates[deals]),
+                expected_prices[deals].tolist(),
+                residuals.tolist(),
+                z_scores[deals].tolist(),
+                strict=True,
+            )
+        ]
+
+    def _price_deviations(
+        self, function_type: RegressionFunctionType, rows: np.ndarray, today: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # Expected price of every car in rows at its own age, from a curve
+        # fitted to those cars, and the robust z-score of its residual.
+        # Negative z-scores are cheaper than expected.
+        x_data, y_data = self._regression_data(today)
+        x_data, y_data = x_data[rows], y_data[rows]
+        if len(x_data) <= 1:
+            return y_data.astype(np.float64), np.zeros(len(x_data))
+
+        params = regression.fit(function_type, x_data, y_data)
+        expected_prices = function_type.function(x_data, *params)
+        return expected_prices, regression.robust_z_scores(y_data - expected_prices)
+
+    def get_similar_cars(
+        self, car_ids: list[str], k: int = 10
+    ) -> list[list[SimilarCar]]:
+        # The k cars of the same manufacturer and model closest to each given
+        # car in normalized price, mileage, horse power and age. The index is
+        # built on the first query and kept until the cars or the day change.
+        today = self._today()
+        if self.similarity_index is None or self.similarity_index_day != today:
+            self.similarity_index = self._build_similarity_index(today)
+            self.similarity_index_day = today
+            self.row_of_id = {}
+            for row, car_id in enumerate(self.frame.ids):
+                self.row_of_id.setdefault(car_id, row)
+
+        unknown_ids = [car_id for car_id in car_ids if car_id not in self.row_of_id]
+        if unknown_ids:
+            msg = f"Unknown car IDs: {', '.join(unknown_ids)}"
+            raise ValueError(msg)
+        rows = np.array([self.row_of_id[car_id] for car_id in car_ids], dtype=np.intp)
+        neighbours, distances = self.similarity_index.query(rows, k)
+
+        similar_cars = []
+        for row_neighbours, row_distances in zip(neighbours, distances, strict=True):
+            found = row_neighbours >= 0
+            similar_cars.append(
+                [
+                    SimilarCar(car=car, distance=distance)
+                    for car, distance in zip(
+                        self._cars_at(row_neighbours[found]),
+                        row_distances[found].tolist(),
+                        strict=True,
+                    )
+                ]
+            )
+        return similar_cars
+
+    def _build_similarity_index(self, today: int) -> SimilarityIndex:
+        columns = [
+            self.prices,
+            self.mileages,
+            self.horse_powers,
+            today - self.first_registration_days,
+        ]
+        features = np.column_stack(
+            [
+                normalize(values, values.min().item(), values.max().item())
+                if len(values)
+                else values
+                for values in columns
+            ]
+        )
+        group_codes, _ = self.frame.group_codes()
+        return SimilarityIndex(features, group_codes)
+
     def get_regression_line(
         self,
         function_type: RegressionFunctionType,
+        bin_days: int | None = None,
+        filter_by_manufacturers: list[str] = [],
+        filter_by_models: list[str] = [],
     ) -> tuple[list[datetime.datetime], list[float]]:
-        now = datetime.datetime.now()
-
-        # Prepare data for regression
-        x_data = np.array(
-            [(now - car.first_registration).days / 365.25 for car in self.cars],
+        parameters = self.fit_regression_parameters(
+            function_type, bin_days, filter_by_manufacturers, filter_by_models
         )
-        y_data = np.array([car.price for car in self.cars])
+        if parameters is None:
+            return [], []
+        return self.get_regression_curve(parameters)
+
+    def fit_regression_parameters(
+        self,
+        function_type: RegressionFunctionType,
+        bin_days: int | None = None,
+        filter_by_manufacturers: list[str] = [],
+        filter_by_models: list[str] = [],
+    ) -> RegressionParameters | None:
+        today = self._today()
+        x_data, y_data = self._regression_data(today)
+        mask = self._filter_mask(filter_by_manufacturers, filter_by_models)
+        x_data, y_data = x_data[mask], y_data[mask]
 
         if len(x_data) <= 1:
-            return [], []
+            return None
+
+        params = self._fit_regression(function_type, x_data, y_data, bin_days)
+        return RegressionParameters(
+            function_type=function_type,
+            params=params.tolist(),
+            reference_time=self._start_of_day(today),
+            min_age=float(x_data.min()),
+            max_age=float(x_data.max()),
+        )
 
-        depreciation_function = function_type.function
+    @staticmethod
+    def get_regression_curve(
+        parameters: RegressionParameters,
+    ) -> tuple[list[datetime.datetime], list[float]]:
+        # Ages are relative to the time of the fit, so the curve is drawn from
+        # there as well and looks the same however old the parameters are.
+        return regression.evaluate_curve(
+            parameters.function_type,
+            np.asarray(parameters.params),
+            parameters.min_age,
+            parameters.max_age,
+            now=parameters.reference_time,
+        )
 
-        params, _ = scipy.optimize.curve_fit(depreciation_function, x_data, y_data)
+    def compare_binned_regression(
+        self, function_type: RegressionFunctionType, bin_days: int
+    ) -> BinnedRegressionDeviation:
+        # Fits once on age bins and once on every car, and reports how far the
+        # binned curve is from the full one.
+        x_data, y_data = self._regression_data(self._today())
+        if len(x_data) <= 1:
+            msg = "Comparing regressions needs at least two cars."
+            raise ValueError(msg)
+        x_means, y_means, counts = self._bin_regression_data(x_data, y_data, bin_days)
+        binned_params = regression.fit(function_type, x_means, y_means, counts)
+        full_params = regression.fit(function_type, x_data, y_data)
 
-        # Generate points for the regression curve
         x_curve = np.linspace(x_data.min(), x_data.max(), 500)
-        y_curve = np.array(
-            [depreciation_function(x_point, *params) for x_point in x_curve]
+        binned_curve = function_type.function(x_curve, *binned_params)
+        full_curve = function_type.function(x_curve, *full_params)
+        deviation = np.abs(binned_curve - full_curve)
+
+        def root_mean_squared_error(params: np.ndarray) -> float:
+            residuals = y_data - function_type.function(x_data, *params)
+            return float(np.sqrt(np.mean(residuals**2)))
+
+        return BinnedRegressionDeviation(
+            bin_days=bin_days,
+            bin_count=len(counts),
+            max_absolute_deviation=float(deviation.max()),
+            max_relative_deviation=float(
+                (deviation / np.maximum(np.abs(full_curve), 1e-10)).max()
+            ),
+            root_mean_squared_error_binned=root_mean_squared_error(binned_params),
+            root_mean_squared_error_full=root_mean_squared_error(full_params),
         )
-        x_curve = np.array(
-            [now - datetime.timedelta(days=x * 365.25) for x in x_curve]
+
+    def _fit_regression(
+        self,
+        function_type: RegressionFunctionType,
+        x_data: np.ndarray,
+        y_data: np.ndarray,
+        bin_days: int | None,
+    ) -> np.ndarray:
+        if bin_days is None:
+            return regression.fit(function_type, x_data, y_data)
+        x_means, y_means, counts = self._bin_regression_data(x_data, y_data, bin_days)
+        return regression.fit(function_type, x_means, y_means, counts)
+
+    @staticmethod
+    def _bin_regression_data(
+        x_data: np.ndarray, y_data: np.ndarray, bin_days: int
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Ages are whole days, so binning on the day count is exact.
+        age_days = np.rint(x_data * regression.DAYS_PER_YEAR).astype(np.int64)
+        return regression.bin_means(age_days // bin_days, x_data, y_data)
+
+    def fit_all_models(self, timeout: float = 10.0) -> list[RegressionModelFit]:
+        x_data, y_data = self._regression_data(self._today())
+
+        if len(x_data) <= 1:
+            return []
+
+        return regression.fit_all_models(x_data, y_data, timeout)
+
+    def get_grouped_regression_lines(
+        self,
+        function_type: RegressionFunctionType,
+        min_group_size: int = 10,
+    ) -> list[GroupedRegressionLine]:
+        today = self._today()
+        x_data, y_data = self._regression_data(today)
+        group_codes, group_keys = self.frame.group_codes()
+        if len(group_keys) == 0:
+            return []
+
+        counts = np.bincount(group_codes)
+        group_params = regression.fit_groups(
+            function_type,
+            group_codes,
+            x_data,
+            y_data,
+            min_group_size=max(min_group_size, 2),
         )
-        return x_curve, y_curve
+        x_min = np.full(len(group_keys), np.inf)
+        x_max = np.full(len(group_keys), -np.inf)
+        np.minimum.at(x_min, group_codes, x_data)
+        np.maximum.at(x_max, group_codes, x_data)
+
+        lines = []
+        for group, params in group_params.items():
+            dates, prices = regression.evaluate_curve(
+                function_type,
+                params,
+                x_min[group],
+                x_max[group],
+                now=self._start_of_day(today),
+            )
+            manufacturer, model = group_keys[group]
+            lines.append(
+                GroupedRegressionLine(
+                    manufacturer=manufacturer,
+                    model=model,
+                    count=int(counts[group]),
+                    params=params.tolist(),
+                    dates=dates,
+                    prices=prices,
+                )
+            )
+
+        lines.sort(key=lambda x: x.count, reverse=True)
+        return lines
+
+    def _regression_data(self, today: int) -> tuple[np.ndarray, np.ndarray]:
+        # Age in years against price.
+        x_data = (today - self.first_registration_days) / regression.DAYS_PER_YEAR
+        return x_data, self.prices
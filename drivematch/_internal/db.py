@@ -1,9 +1,121 @@
 import datetime
+import itertools
+import json
+import queue
 import re
 import sqlite3
+import threading
 from abc import ABC, abstractmethod
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager, nullcontext
 
-from drivematch.types import Car, Search
+import numpy as np
+
+from drivematch._internal.sketches import QuantileSketch
+from drivematch.types import (
+    Car,
+    CarFrame,
+    MarketTrend,
+    PriceHistories,
+    RegressionFunctionType,
+    RegressionParameters,
+    Search,
+    epoch_day,
+)
+
+# One row per scrape in the order of the (id, timestamp) primary key index, so
+# neither the window nor the ORDER BY needs a sort. Dates are in microseconds,
+# and the integer division truncates the days on market.
+PRICE_HISTORIES = """
+    SELECT id, timestamp, price, mileage,
+        (MAX(timestamp) OVER listing - MIN(advertisedSince) OVER listing)
+        / 86400000000
+    FROM cars
+    {where}
+    WINDOW listing AS (
+        PARTITION BY id ORDER BY timestamp
+        ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+    )
+    ORDER BY id, timestamp
+"""
+
+# Seeks the links of the search in searches_cars_by_search and every linked
+# car in cars_by_scrape_date, so no table is scanned.
+CARS_FOR_SEARCH = """
+    FROM searches
+    INNER JOIN searches_cars ON searches_cars.search_id = searches.id
+    INNER JOIN cars ON cars.id = searches_cars.car_id
+        AND cars.scrapeDate = searches.scrapeDate
+    WHERE searches.id = ?
+"""
+
+# Stores the number of cars get_cars_for_search returns in amountOfCars, for
+# every search or for the searches of the given scrape days. Every listing of
+# a car on the scrape day of a search counts.
+COUNT_CARS_OF_SEARCHES = """
+    UPDATE searches SET amountOfCars = (
+        SELECT COUNT(*) FROM searches_cars
+        INNER JOIN cars ON cars.id = searches_cars.car_id
+            AND cars.scrapeDate = searches.scrapeDate
+        WHERE searches_cars.search_id = searches.id
+    )
+"""
+COUNT_CARS_OF_SEARCHES_OF_DAYS = """
+    UPDATE searches SET amountOfCars = (
+        SELECT COUNT(*) FROM searches_cars
+        INNER JOIN cars ON cars.id = searches_cars.car_id
+            AND cars.scrapeDate = searches.scrapeDate
+        WHERE searches_cars.search_id = searches.id
+    )
+    WHERE scrapeDate IN (SELECT value FROM json_each(?))
+"""
+
+# The cars of a search with the IDs of their attributes. The links come in
+# the order they were inserted from searches_cars_by_search, whose entries end
+# in the rowid, so only the few rows of each car are sorted.
+CARS_WITH_ATTRIBUTES = """
+    SELECT cars.id, cars.timestamp, cars.manufacturer, cars.model,
+        cars.description, cars.price, cars.firstRegistration, cars.mileage,
+        cars.horsePower, cars.fuelType, cars.advertisedSince,
+        cars.privateSeller, cars.detailsURL, cars.imageURL, cars.attributeIds
+    FROM searches
+    INNER JOIN searches_cars ON searches_cars.search_id = searches.id
+    INNER JOIN cars ON cars.id = searches_cars.car_id
+        AND cars.scrapeDate = searches.scrapeDate
+    WHERE searches.id = ?
+    ORDER BY searches_cars.rowid, cars.timestamp
+"""
+
+# cars.attributeIds holds the IDs of a car's attributes in order, packed as
+# little-endian 32-bit integers. They are read with the row of the car, and
+# the IDs of many rows decode at once.
+ATTRIBUTE_ID_DTYPE = np.dtype("<i4")
+
+
+# Dates of cars are stored as microseconds since the epoch, the representation
+# of the datetime64[us] columns of CarFrame, so whole columns convert by a cast.
+def _datetimes(values: Sequence[int]) -> np.ndarray:
+    return np.array(values, dtype=np.int64).astype("datetime64[us]")
+
+
+# Stored in PRAGMA user_version. Databases of older versions are upgraded by
+# SQLiteSearchesRepository._migrate.
+SCHEMA_VERSION = 5
+
+# Applied to every connection in concurrent mode. With the write-ahead log,
+# readers see the last commit while a write is in progress, so neither waits
+# for the other. Syncing only at checkpoints keeps the database consistent,
+# but the last commits can be lost on a power failure.
+CONCURRENT_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Upper bound of the read connections opened in concurrent mode. Every one
+# has a page cache of its own.
+READ_CONNECTIONS = 4
 
 
 class SearchesRepository(ABC):
@@ -21,118 +133,640 @@ class SearchesRepository(ABC):
     def get_cars_for_search(self, search_id: str) -> list[Car]:
         pass
 
+    @abstractmethod
+    def get_car_frame_for_search(self, search_id: str) -> CarFrame:
+        pass
+
+    @abstractmethod
+    def iter_car_frames_for_search(
+        self, search_id: str, batch_size: int = 10000
+    ) -> Iterator[CarFrame]:
+        pass
+
+    @abstractmethod
+    def get_price_histories(self, car_ids: list[str] | None = None) -> PriceHistories:
+        pass
+
+    @abstractmethod
+    def get_market_trends(
+        self,
+        search_name: str,
+        manufacturers: list[str] = [],
+        models: list[str] = [],
+    ) -> list[MarketTrend]:
+        pass
+
     @abstractmethod
     def get_searches(self) -> list[Search]:
         pass
 
+    @abstractmethod
+    def get_fingerprint_for_search(self, search_id: str) -> str:
+        pass
+
+    @abstractmethod
+    def get_fingerprint_for_all_searches(self) -> str:
+        pass
+
+    @abstractmethod
+    def get_searches_version(self) -> str:
+        pass
+
+    @abstractmethod
+    def get_regression_parameters(
+        self,
+        search_id: str,
+        function_type: RegressionFunctionType,
+        filter_key: str,
+        fingerprint: str,
+    ) -> RegressionParameters | None:
+        pass
+
+    @abstractmethod
+    def save_regression_parameters(
+        self,
+        search_id: str,
+        filter_key: str,
+        fingerprint: str,
+        parameters: RegressionParameters,
+    ) -> None:
+        pass
+
+    @abstractmethod
+    def get_quantile_sketches(
+        self, search_id: str, fingerprint: str
+    ) -> dict[tuple[str, str], dict[str, QuantileSketch]] | None:
+        pass
+
+    @abstractmethod
+    def save_quantile_sketches(
+        self,
+        search_id: str,
+        fingerprint: str,
+        sketches: dict[tuple[str, str], dict[str, QuantileSketch]],
+    ) -> None:
+        pass
+
 
 class SQLiteSearchesRepository(SearchesRepository):
-    def __init__(self, db_path: str) -> None:
-        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+    # By default all methods share one connection. In concurrent mode, e.g.
+    # for a web server, the database runs in WAL mode and every read checks
+    # out one of a few read connections, while writes go through the one
+    # writer connection, one transaction at a time.
+    def __init__(self, db_path: str, *, concurrent: bool = False) -> None:
+        self.db_path = db_path
+        self.concurrent = concurrent
+        self.write_lock = threading.Lock()
+        self.read_connections: list[sqlite3.Connection] = []
+        # Idle read connections, most recently used first. A None stands for
+        # one that is not opened yet.
+        self.idle_read_connections: queue.LifoQueue[sqlite3.Connection | None] = (
+            queue.LifoQueue()
+        )
+        for _ in range(READ_CONNECTIONS):
+            self.idle_read_connections.put(None)
+        self.connection = self._connect()
+        if concurrent:
+            # Every connection to an in-memory database has a database of its own.
+            if db_path == ":memory:":
+                msg = "Concurrent mode needs a database file."
+                raise ValueError(msg)
+            self.connection.execute("PRAGMA journal_mode = WAL")
         self.cursor = self.connection.cursor()
 
+        is_new_database = not self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'searches'"
+        ).fetchone()
         self.cursor.execute(
-            "CREATE TABLE IF NOT EXISTS searches (id TEXT PRIMARY KEY, name TEXT, url TEXT, timestamp DATETIME)"
+            "CREATE TABLE IF NOT EXISTS searches (id TEXT PRIMARY KEY, name TEXT, url TEXT, timestamp DATETIME, amountOfCars INTEGER, scrapeDate INTEGER)"
         )
         self.cursor.execute(
             "CREATE TABLE IF NOT EXISTS searches_cars (search_id TEXT, car_id TEXT, FOREIGN KEY (search_id) REFERENCES searches(id), FOREIGN KEY (car_id) REFERENCES cars(id))"
         )
         self.cursor.execute(
-            "CREATE TABLE IF NOT EXISTS cars (id TEXT, timestamp DATETIME, manufacturer TEXT, model TEXT, description TEXT, price INTEGER, attributes TEXT, firstRegistration DATETIME, mileage INTEGER, horsePower INTEGER, fuelType TEXT, advertisedSince DATETIME, privateSeller INTEGER, detailsURL TEXT, imageURL TEXT, PRIMARY KEY (id, timestamp))"
+            "CREATE TABLE IF NOT EXISTS cars (id TEXT, timestamp INTEGER, manufacturer TEXT, model TEXT, description TEXT, price INTEGER, firstRegistration INTEGER, mileage INTEGER, horsePower INTEGER, fuelType TEXT, advertisedSince INTEGER, privateSeller INTEGER, detailsURL TEXT, imageURL TEXT, scrapeDate INTEGER, attributeIds BLOB, PRIMARY KEY (id, timestamp))"
+        )
+        self.cursor.execute(
+            "CREATE TABLE IF NOT EXISTS regression_parameters (search_id TEXT, functionType TEXT, filterKey TEXT, fingerprint TEXT, params TEXT, referenceTime DATETIME, minAge REAL, maxAge REAL, PRIMARY KEY (search_id, functionType, filterKey), FOREIGN KEY (search_id) REFERENCES searches(id))"
+        )
+        self.cursor.execute(
+            "CREATE TABLE IF NOT EXISTS attributes (id INTEGER PRIMARY KEY, name TEXT UNIQUE)"
+        )
+        if is_new_database:
+            self.cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        else:
+            self._migrate(self.cursor.execute("PRAGMA user_version").fetchone()[0])
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS searches_cars_by_search ON searches_cars (search_id)"
+        )
+        # Also covers the columns summarized by get_fingerprint_for_search.
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS cars_by_scrape_date ON cars (id, scrapeDate, timestamp, price, mileage, firstRegistration)"
+        )
+        # The backfills below read through connections that only see commits.
+        self.connection.commit()
+        has_market_trends = self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'market_trends'"
+        ).fetchone()
+        self.cursor.execute(
+            "CREATE TABLE IF NOT EXISTS market_trends (searchName TEXT, scrapeDate DATE, manufacturer TEXT, model TEXT, count INTEGER, meanPrice REAL, medianPrice REAL, meanMileage REAL, medianMileage REAL, PRIMARY KEY (searchName, scrapeDate, manufacturer, model))"
+        )
+        if not has_market_trends:
+            self._backfill_market_trends()
+        search_columns = [
+            row[1] for row in self.cursor.execute("PRAGMA table_info(searches)")
+        ]
+        if "amountOfCars" not in search_columns:
+            # Counts the cars of searches stored before the column existed once.
+            self.cursor.execute("ALTER TABLE searches ADD COLUMN amountOfCars INTEGER")
+            self.cursor.execute(COUNT_CARS_OF_SEARCHES)
+        self.cursor.execute(
+            "CREATE TABLE IF NOT EXISTS quantile_sketches (search_id TEXT, fingerprint TEXT, manufacturer TEXT, model TEXT, metric TEXT, sketch TEXT, PRIMARY KEY (search_id, manufacturer, model, metric), FOREIGN KEY (search_id) REFERENCES searches(id))"
         )
 
         self.connection.commit()
 
     def __del__(self) -> None:
+        for connection in self.read_connections:
+            connection.close()
         self.connection.close()
 
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        if self.concurrent:
+            for pragma in CONCURRENT_PRAGMAS:
+                connection.execute(pragma)
+        return connection
+
+    @contextmanager
+    def _reading(self) -> Iterator[sqlite3.Cursor]:
+        # A fresh cursor for the block, so no two reads share cursor state. In
+        # concurrent mode its connection is checked out of the pool until the
+        # block ends, waiting while all of them are in use.
+        if not self.concurrent:
+            yield self.connection.cursor()
+            return
+        connection = self.idle_read_connections.get()
+        try:
+            if connection is None:
+                connection = self._connect()
+                connection.execute("PRAGMA query_only = ON")
+                self.read_connections.append(connection)
+            yield connection.cursor()
+        finally:
+            self.idle_read_connections.put(connection)
+
+    @contextmanager
+    def _reading_snapshot(self) -> Iterator[sqlite3.Cursor]:
+        # Like _reading(), but every query of the block reads the same commit,
+        # even if other connections commit in between. By default the shared
+        # connection is held like for a write, so the read transaction neither
+        # joins nor commits a write of another thread.
+        lock = nullcontext() if self.concurrent else self.write_lock
+        with lock, self._reading() as cursor:
+            if cursor.connection.in_transaction:
+                yield cursor
+                return
+            cursor.execute("BEGIN")
+            try:
+                yield cursor
+            finally:
+                cursor.connection.commit()
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        # Writes of the block go through self.cursor, one writer at a time, and
+        # are committed, or rolled back on an error.
+        with self.write_lock, self.connection:
+            yield
+
+    def _migrate(self, version: int) -> None:
+        # Upgrades a database written at an older schema version in place, one
+        # version at a time. The migrations and the new version are committed
+        # in one transaction, which sqlite3 does not begin before DDL, so an
+        # interrupted upgrade leaves the database at its old version.
+        migrations = [
+            self._add_scrape_dates,
+            self._store_dates_as_integers,
+            self._normalize_attributes,
+            self._index_links_in_insertion_order,
+            self._inline_attributes,
+        ]
+        self.cursor.execute("BEGIN")
+        with self.connection:
+            for migration in migrations[version:]:
+                migration()
+            self.cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _add_scrape_dates(self) -> None:
+        # Cars used to be matched to their search on DATE() of both
+        # timestamps, which no index can serve.
+        self.cursor.execute("ALTER TABLE searches ADD COLUMN scrapeDate DATE")
+        self.cursor.execute("UPDATE searches SET scrapeDate = DATE(timestamp)")
+        self.cursor.execute("ALTER TABLE cars ADD COLUMN scrapeDate DATE")
+        self.cursor.execute("UPDATE cars SET scrapeDate = DATE(timestamp)")
+
+    def _store_dates_as_integers(self) -> None:
+        # Dates of cars used to be ISO 8601 strings and scrape dates DATE()
+        # strings. A missing fraction of a second counts as zero microseconds.
+        # The columns keep their declared types, whose NUMERIC affinity stores
+        # integers as they are.
+        self.cursor.execute(
+            """
+            UPDATE cars SET
+                timestamp = CAST(strftime('%s', timestamp) AS INTEGER) * 1000000
+                    + CAST(SUBSTR(timestamp || '.000000', 21, 6) AS INTEGER),
+                firstRegistration =
+                    CAST(strftime('%s', firstRegistration) AS INTEGER) * 1000000
+                    + CAST(SUBSTR(firstRegistration || '.000000', 21, 6) AS INTEGER),
+                advertisedSince =
+                    CAST(strftime('%s', advertisedSince) AS INTEGER) * 1000000
+                    + CAST(SUBSTR(advertisedSince || '.000000', 21, 6) AS INTEGER),
+                scrapeDate = CAST(strftime('%s', scrapeDate) AS INTEGER) / 86400
+            """
+        )
+        self.cursor.execute(
+            "UPDATE searches SET "
+            "scrapeDate = CAST(strftime('%s', scrapeDate) AS INTEGER) / 86400"
+        )
+
+    def _normalize_attributes(self) -> None:
+        # Attributes used to be joined by commas into cars.attributes, which
+        # is cleared once they are moved. Such a list could not hold a comma,
+        # and an empty one was stored as an empty string.
+        attributes_of_cars = [
+            (car_id, timestamp, attributes.split(",") if attributes else [])
+            for car_id, timestamp, attributes in self.cursor.execute(
+                "SELECT id, timestamp, attributes FROM cars"
+            ).fetchall()
+        ]
+        attribute_ids = self._attribute_ids(
+            list({name for _, _, names in attributes_of_cars for name in names})
+        )
+        self.cursor.execute(
+            "CREATE TABLE cars_attributes (carId TEXT, timestamp INTEGER, position INTEGER, attributeId INTEGER, PRIMARY KEY (carId, timestamp, position), FOREIGN KEY (attributeId) REFERENCES attributes(id)) WITHOUT ROWID"
+        )
+        self.cursor.executemany(
+            "INSERT INTO cars_attributes (carId, timestamp, position, attributeId) VALUES (?, ?, ?, ?)",
+            [
+                (car_id, timestamp, position, attribute_ids[name])
+                for car_id, timestamp, names in attributes_of_cars
+                for position, name in enumerate(names)
+            ],
+        )
+        self.cursor.execute("UPDATE cars SET attributes = NULL")
+
+    def _index_links_in_insertion_order(self) -> None:
+        # searches_cars_by_search used to be on (search_id, car_id), which
+        # returns the cars of a search in car ID order. It is created again
+        # on search_id alone.
+        self.cursor.execute("DROP INDEX IF EXISTS searches_cars_by_search")
+
+    def _inline_attributes(self) -> None:
+        # Attribute IDs used to be rows of a cars_attributes join table, which
+        # loading a search had to seek once per car. They are read in one pass
+        # in the order of its primary key and packed into cars.attributeIds.
+        self.cursor.execute("ALTER TABLE cars ADD COLUMN attributeIds BLOB")
+        self.cursor.execute("UPDATE cars SET attributeIds = x''")
+        rows = self.cursor.execute(
+            "SELECT carId, timestamp, attributeId FROM cars_attributes "
+            "ORDER BY carId, timestamp, position"
+        ).fetchall()
+        self.cursor.executemany(
+            "UPDATE cars SET attributeIds = ? WHERE id = ? AND timestamp = ?",
+            [
+                (
+                    np.array(
+                        [row[2] for row in attributes], dtype=ATTRIBUTE_ID_DTYPE
+                    ).tobytes(),
+                    car_id,
+                    timestamp,
+                )
+                for (car_id, timestamp), attributes in itertools.groupby(
+                    rows, key=lambda row: row[:2]
+                )
+            ],
+        )
+        self.cursor.execute("DROP TABLE cars_attributes")
+
+    def _attribute_ids(self, names: list[str]) -> dict[str, int]:
+        # IDs of attribute names. New names are added to the lookup table.
+        self.cursor.executemany(
+            "INSERT OR IGNORE INTO attributes (name) VALUES (?)",
+            [(name,) for name in names],
+        )
+        return dict(
+            self.cursor.execute(
+                "SELECT name, id FROM attributes "
+                "WHERE name IN (SELECT value FROM json_each(?))",
+                (json.dumps(names),),
+            ).fetchall()
+        )
+
     def insert_cars_for_search(
         self, search_id: str, name: str, url: str, cars: list[Car]
     ) -> None:
-        current_datetime = datetime.datetime.now().isoformat()
+        now = datetime.datetime.now()
+        current_datetime = now.isoformat()
+        # Dates and attributes are stored from the columns of the frame, which
+        # also gives the market trends.
+        frame = CarFrame.from_cars(cars)
+        scrape_days = frame.timestamps.astype("datetime64[D]").astype(np.int64)
+        with self._writing():
+            self.cursor.execute(
+                (
+                    "INSERT INTO searches (id, name, url, timestamp, amountOfCars,"
+                    "scrapeDate) VALUES (?, ?, ?, ?, ?, ?)"
+                ),
+                (
+                    search_id,
+                    name,
+                    url,
+                    current_datetime,
+                    len(cars),
+                    epoch_day(now),
+                ),
+            )
+            self.cursor.executemany(
+                (
+                    "INSERT INTO cars (id, timestamp, manufacturer, model,"
+                    "description, price, firstRegistration, mileage,"
+                    "horsePower, fuelType, advertisedSince, privateSeller,"
+                    "detailsURL, imageURL, scrapeDate, attributeIds)"
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                ),
+                [
+                    (
+                        car.id,
+                        timestamp,
+                        car.manufacturer,
+                        car.model,
+                        car.description,
+                        car.price,
+                        first_registration,
+                        car.mileage,
+                        car.horse_power,
+                        car.fuel_type,
+                        advertised_since,
+                        int(car.private_seller),
+                        car.details_url,
+                        car.image_url,
+                        scrape_day,
+                        attribute_ids,
+                    )
+                    for (
+                        car,
+                        timestamp,
+                        first_registration,
+                        advertised_since,
+                        scrape_day,
+                        attribute_ids,
+                    ) in zip(
+                        cars,
+                        frame.timestamps.astype(np.int64).tolist(),
+                        frame.first_registrations.astype(np.int64).tolist(),
+                        frame.advertised_sinces.astype(np.int64).tolist(),
+                        scrape_days.tolist(),
+                        self._packed_attribute_ids(frame),
+                        strict=True,
+                    )
+                ],
+            )
+            self.cursor.executemany(
+                "INSERT INTO searches_cars (search_id, car_id) VALUES (?, ?)",
+                [(search_id, car.id) for car in cars],
+            )
+            # A car scraped again on the same day is listed by every search of
+            # that day that has it, so those are counted again as well.
+            self.cursor.execute(
+                COUNT_CARS_OF_SEARCHES_OF_DAYS,
+                (json.dumps(sorted({epoch_day(now), *scrape_days.tolist()})),),
+            )
+            self._replace_market_trends(name, current_datetime[:10], frame)
+
+    def _packed_attribute_ids(self, frame: CarFrame) -> list[bytes]:
+        # The cars.attributeIds of every row of the frame.
+        attribute_ids = self._attribute_ids(frame.attribute_names)
+        packed = np.array(
+            [attribute_ids[name] for name in frame.attribute_names],
+            dtype=ATTRIBUTE_ID_DTYPE,
+        )[frame.attribute_codes].tobytes()
+        bounds = (frame.attribute_offsets * ATTRIBUTE_ID_DTYPE.itemsize).tolist()
+        return [packed[start:end] for start, end in itertools.pairwise(bounds)]
+
+    def _replace_market_trends(
+        self, search_name: str, scrape_date: str, frame: CarFrame
+    ) -> None:
+        # Aggregates of one scrape replace those of earlier scrapes of the
+        # same search name on the same day, so only a few rows are touched.
         self.cursor.execute(
-            ("INSERT INTO searches (id, name, url, timestamp)VALUES (?, ?, ?, ?)"),
-            (search_id, name, url, current_datetime),
+            "DELETE FROM market_trends WHERE searchName = ? AND scrapeDate = ?",
+            (search_name, scrape_date),
         )
+        if len(frame) == 0:
+            return
+        group_codes, group_keys = frame.group_codes()
+        order = np.argsort(group_codes, kind="stable")
+        boundaries = np.cumsum(np.bincount(group_codes))[:-1]
+        group_prices = np.split(frame.prices[order], boundaries)
+        group_mileages = np.split(frame.mileages[order], boundaries)
         self.cursor.executemany(
-            (
-                "INSERT INTO cars (id, timestamp, manufacturer, model,"
-                "description, price, attributes, firstRegistration, mileage,"
-                "horsePower, fuelType, advertisedSince, privateSeller,"
-                "detailsURL, imageURL)"
-                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
-            ),
+            "INSERT INTO market_trends (searchName, scrapeDate, manufacturer, model, count, meanPrice, medianPrice, meanMileage, medianMileage) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
             [
                 (
-                    car.id,
-                    car.timestamp.isoformat(),
-                    car.manufacturer,
-                    car.model,
-                    car.description,
-                    car.price,
-                    ",".join(car.attributes),
-                    car.first_registration.isoformat(),
-                    car.mileage,
-                    car.horse_power,
-                    car.fuel_type,
-                    car.advertised_since.isoformat(),
-                    car.private_seller,
-                    car.details_url,
-                    car.image_url,
+                    search_name,
+                    scrape_date,
+                    manufacturer,
+                    model,
+                    len(prices),
+                    float(prices.mean()),
+                    float(np.median(prices)),
+                    float(mileages.mean()),
+                    float(np.median(mileages)),
+                )
+                for (manufacturer, model), prices, mileages in zip(
+                    group_keys, group_prices, group_mileages, strict=True
                 )
-                for car in cars
             ],
         )
-        self.cursor.executemany(
-            "INSERT INTO searches_cars (search_id, car_id) VALUES (?, ?)",
-            [(search_id, car.id) for car in cars],
+
+    def _backfill_market_trends(self) -> None:
+        # Databases from before the trend table get it filled once from the
+        # searches they already hold, oldest first.
+        searches = self.cursor.execute(
+            "SELECT id, name, timestamp FROM searches ORDER BY timestamp"
+        ).fetchall()
+        for search_id, name, timestamp in searches:
+            # A car re-listed on the same day joins the search once per
+            # listing; only its latest one counts, as at insert time.
+            cars = sorted(
+                self.get_cars_for_search(search_id), key=lambda car: car.timestamp
+            )
+            latest_cars = list({car.id: car for car in cars}.values())
+            self._replace_market_trends(
+                name, timestamp[:10], CarFrame.from_cars(latest_cars)
+            )
+
+    def get_market_trends(
+        self,
+        search_name: str,
+        manufacturers: list[str] = [],
+        models: list[str] = [],
+    ) -> list[MarketTrend]:
+        query = (
+            "SELECT searchName, scrapeDate, manufacturer, model, count, meanPrice, "
+            "medianPrice, meanMileage, medianMileage FROM market_trends "
+            "WHERE searchName = ?"
         )
-        self.connection.commit()
+        parameters = [search_name]
+        if manufacturers:
+            query += (
+                " AND LOWER(manufacturer) IN (SELECT LOWER(value) FROM json_each(?))"
+            )
+            parameters.append(json.dumps(manufacturers))
+        if models:
+            query += " AND LOWER(model) IN (SELECT LOWER(value) FROM json_each(?))"
+            parameters.append(json.dumps(models))
+        with self._reading() as cursor:
+            cursor.execute(query + " ORDER BY scrapeDate, count DESC", parameters)
+            rows = cursor.fetchall()
+        return [
+            MarketTrend(
+                search_name=row[0],
+                scrape_date=datetime.date.fromisoformat(row[1]),
+                manufacturer=row[2],
+                model=row[3],
+                count=row[4],
+                mean_price=row[5],
+                median_price=row[6],
+                mean_mileage=row[7],
+                median_mileage=row[8],
+            )
+            for row in rows
+        ]
 
     def get_cars_for_search(self, search_id: str, batch_size: int = 100) -> list[Car]:
-        self.cursor.execute(
-            """
-            SELECT cars.*
-            FROM cars
-            INNER JOIN searches_cars ON cars.id = searches_cars.car_id
-            INNER JOIN searches ON searches_cars.search_id = searches.id
-            WHERE searches.id = ? AND DATE(cars.timestamp) = DATE(searches.timestamp)
-        """,
-            (search_id,),
-        )
-
-        cars = []
-
-        while True:
-            rows = self.cursor.fetchmany(batch_size)
-            if not rows:
-                break
-
-            for row in rows:
-                car = Car(
-                    id=row[0],
-                    timestamp=datetime.datetime.fromisoformat(row[1]),
-                    manufacturer=row[2],
-                    model=row[3],
-                    description=row[4],
-                    price=row[5],
-                    attributes=row[6].split(","),
-                    first_registration=datetime.datetime.fromisoformat(row[7]),
-                    mileage=row[8],
-                    horse_power=row[9],
-                    fuel_type=row[10],
-                    advertised_since=datetime.datetime.fromisoformat(row[11]),
-                    private_seller=bool(row[12]),
-                    details_url=row[13],
-                    image_url=row[14],
+        return self.get_car_frame_for_search(search_id, batch_size).to_cars()
+
+    def get_car_frame_for_search(
+        self, search_id: str, batch_size: int = 10000
+    ) -> CarFrame:
+        with self._reading_snapshot() as cursor:
+            cursor.execute(CARS_WITH_ATTRIBUTES, (search_id,))
+
+            rows = []
+
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                rows.extend(batch)
+
+            attribute_names = self._attribute_names(cursor)
+        return self._frame_from_rows(rows, attribute_names)
+
+    def iter_car_frames_for_search(
+        self, search_id: str, batch_size: int = 10000
+    ) -> Iterator[CarFrame]:
+        # One frame per batch of rows, so only a single batch is in memory at
+        # a time. Other queries can run in between. Attribute names are read
+        # once the query for the cars has started, so both read the same
+        # commit: the read transaction of the connection lasts while that
+        # query is unfinished.
+        with self._reading() as cursor:
+            cursor.execute(CARS_WITH_ATTRIBUTES, (search_id,))
+            attribute_names = self._attribute_names(cursor.connection.cursor())
+            try:
+                while batch := cursor.fetchmany(batch_size):
+                    yield self._frame_from_rows(batch, attribute_names)
+            finally:
+                cursor.close()
+
+    @staticmethod
+    def _attribute_names(cursor: sqlite3.Cursor) -> dict[int, str]:
+        return dict(cursor.execute("SELECT id, name FROM attributes").fetchall())
+
+    @staticmethod
+    def _frame_from_rows(
+        rows: list[tuple], attribute_names: dict[int, str]
+    ) -> CarFrame:
+        columns = list(zip(*rows, strict=True)) if rows else [()] * 15
+
+        # Attribute IDs of the whole database are renumbered into codes of the
+        # names that occur in these rows.
+        attribute_offsets = np.zeros(len(rows) + 1, dtype=np.intp)
+        np.cumsum(
+            np.fromiter(map(len, columns[14]), dtype=np.intp, count=len(rows))
+            // ATTRIBUTE_ID_DTYPE.itemsize,
+            out=attribute_offsets[1:],
+        )
+        used_ids, attribute_codes = np.unique(
+            np.frombuffer(b"".join(columns[14]), dtype=ATTRIBUTE_ID_DTYPE),
+            return_inverse=True,
+        )
+        return CarFrame.from_columns(
+            ids=columns[0],
+            timestamps=_datetimes(columns[1]),
+            manufacturers=columns[2],
+            models=columns[3],
+            descriptions=columns[4],
+            prices=columns[5],
+            attribute_offsets=attribute_offsets,
+            attribute_codes=attribute_codes,
+            attribute_names=[attribute_names[id_] for id_ in used_ids.tolist()],
+            first_registrations=_datetimes(columns[6]),
+            mileages=columns[7],
+            horse_powers=columns[8],
+            fuel_types=columns[9],
+            advertised_sinces=_datetimes(columns[10]),
+            private_sellers=columns[11],
+            details_urls=columns[12],
+            image_urls=columns[13],
+        )
+
+    def get_price_histories(
+        self, car_ids: list[str] | None = None, batch_size: int = 10000
+    ) -> PriceHistories:
+        # The history of every car, or of the given cars, in one query. The
+        # IDs are passed as a single JSON array to stay clear of the limit on
+        # SQL variables.
+        with self._reading() as cursor:
+            if car_ids is None:
+                cursor.execute(PRICE_HISTORIES.format(where=""))
+            else:
+                cursor.execute(
+                    PRICE_HISTORIES.format(
+                        where="WHERE id IN (SELECT value FROM json_each(?))"
+                    ),
+                    (json.dumps(car_ids),),
                 )
-                cars.append(car)
 
-        return cars
+            rows = []
+            while batch := cursor.fetchmany(batch_size):
+                rows.extend(batch)
+        ids, timestamps, prices, mileages, days_on_market = (
+            list(zip(*rows, strict=True)) if rows else [()] * 5
+        )
+
+        ids = np.array(ids, dtype=object)
+        starts_new_car = np.ones(len(ids), dtype=np.bool_)
+        starts_new_car[1:] = ids[1:] != ids[:-1]
+        first_rows = np.flatnonzero(starts_new_car)
+        return PriceHistories(
+            car_ids=ids[first_rows].tolist(),
+            offsets=np.append(first_rows, len(rows)).astype(np.intp),
+            timestamps=_datetimes(timestamps),
+            prices=np.array(prices, dtype=np.int64),
+            mileages=np.array(mileages, dtype=np.int64),
+            days_on_market=np.array(days_on_market, dtype=np.int64)[first_rows],
+        )
 
     def get_searches(self) -> list[Search]:
-        self.cursor.execute("SELECT * FROM searches")
-        rows = self.cursor.fetchall()
+        with self._reading() as cursor:
+            cursor.execute(
+                "SELECT id, name, url, timestamp, amountOfCars FROM searches"
+            )
+            rows = cursor.fetchall()
         searches = []
         for row in rows:
             search = Search(
@@ -140,8 +774,131 @@ class SQLiteSearchesRepository(SearchesRepository):
                 name=row[1],
                 url=row[2],
                 timestamp=row[3],
-                amount_of_cars=len(self.get_cars_for_search(row[0])),
+                amount_of_cars=row[4],
             )
             searches.append(search)
-        self.connection.commit()
         return searches
+
+    def get_fingerprint_for_search(self, search_id: str) -> str:
+        # Summarizes the cars of a search without loading them, so cached
+        # results can be checked against the data they were computed from.
+        with self._reading() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*), TOTAL(cars.price), TOTAL(cars.mileage), "
+                "MIN(cars.firstRegistration), MAX(cars.firstRegistration), "
+                "MAX(cars.timestamp) " + CARS_FOR_SEARCH,
+                (search_id,),
+            )
+            return json.dumps(cursor.fetchone())
+
+    def get_fingerprint_for_all_searches(self) -> str:
+        # The same summary over the cars of every search, in one query.
+        with self._reading() as cursor:
+            cursor.execute(
+                """
+                SELECT COUNT(*), TOTAL(cars.price), TOTAL(cars.mileage),
+                    MIN(cars.firstRegistration), MAX(cars.firstRegistration),
+                    MAX(cars.timestamp)
+                FROM searches
+                INNER JOIN searches_cars ON searches_cars.search_id = searches.id
+                INNER JOIN cars ON cars.id = searches_cars.car_id
+                    AND cars.scrapeDate = searches.scrapeDate
+                """
+            )
+            return json.dumps(cursor.fetchone())
+
+    def get_searches_version(self) -> str:
+        # Changes whenever a search is stored, which is the only way cars are
+        # written, so fingerprints only need to be checked again after that.
+        with self._reading() as cursor:
+            cursor.execute("SELECT COUNT(*), MAX(rowid) FROM searches")
+            return json.dumps(cursor.fetchone())
+
+    def get_regression_parameters(
+        self,
+        search_id: str,
+        function_type: RegressionFunctionType,
+        filter_key: str,
+        fingerprint: str,
+    ) -> RegressionParameters | None:
+        with self._reading() as cursor:
+            cursor.execute(
+                "SELECT params, referenceTime, minAge, maxAge FROM regression_parameters WHERE search_id = ? AND functionType = ? AND filterKey = ? AND fingerprint = ?",
+                (search_id, function_type.name, filter_key, fingerprint),
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        return RegressionParameters(
+            function_type=function_type,
+            params=json.loads(row[0]),
+            reference_time=datetime.datetime.fromisoformat(row[1]),
+            min_age=row[2],
+            max_age=row[3],
+        )
+
+    def save_regression_parameters(
+        self,
+        search_id: str,
+        filter_key: str,
+        fingerprint: str,
+        parameters: RegressionParameters,
+    ) -> None:
+        with self._writing():
+            self.cursor.execute(
+                "INSERT OR REPLACE INTO regression_parameters (search_id, functionType, filterKey, fingerprint, params, referenceTime, minAge, maxAge) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    search_id,
+                    parameters.function_type.name,
+                    filter_key,
+                    fingerprint,
+                    json.dumps(parameters.params),
+                    parameters.reference_time.isoformat(),
+                    parameters.min_age,
+                    parameters.max_age,
+                ),
+            )
+
+    def get_quantile_sketches(
+        self, search_id: str, fingerprint: str
+    ) -> dict[tuple[str, str], dict[str, QuantileSketch]] | None:
+        with self._reading() as cursor:
+            cursor.execute(
+                "SELECT manufacturer, model, metric, sketch FROM quantile_sketches WHERE search_id = ? AND fingerprint = ?",
+                (search_id, fingerprint),
+            )
+            rows = cursor.fetchall()
+        if not rows:
+            return None
+        sketches: dict[tuple[str, str], dict[str, QuantileSketch]] = {}
+        for manufacturer, model, metric, sketch in rows:
+            sketches.setdefault((manufacturer, model), {})[metric] = (
+                QuantileSketch.from_json(sketch)
+            )
+        return sketches
+
+    def save_quantile_sketches(
+        self,
+        search_id: str,
+        fingerprint: str,
+        sketches: dict[tuple[str, str], dict[str, QuantileSketch]],
+    ) -> None:
+        with self._writing():
+            self.cursor.execute(
+                "DELETE FROM quantile_sketches WHERE search_id = ?", (search_id,)
+            )
+            self.cursor.executemany(
+                "INSERT INTO quantile_sketches (search_id, fingerprint, manufacturer, model, metric, sketch) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        search_id,
+                        fingerprint,
+                        manufacturer,
+                        model,
+                        metric,
+                        sketch.to_json(),
+                    )
+                    for (manufacturer, model), metric_sketches in sketches.items()
+                    for metric, sketch in metric_sketches.items()
+                ],
+            )
@@ -0,0 +1,334 @@
+import datetime
+import math
+import multiprocessing
+import time
+from collections.abc import Callable
+from functools import partial
+
+import numpy as np
+import scipy.optimize
+
+from drivematch._internal import regression_functions
+from drivematch.types import RegressionFunctionType, RegressionModelFit
+
+DAYS_PER_YEAR = 365.25
+
+# Makes the median absolute deviation an estimate of the standard deviation
+# for normally distributed values.
+MAD_SCALE = 1.4826
+
+LINEAR_DESIGN_MATRICES: dict[
+    RegressionFunctionType, Callable[[np.ndarray], np.ndarray]
+] = {
+    RegressionFunctionType.LINEAR: regression_functions.linear_design_matrix,
+    RegressionFunctionType.POLYNOMIAL_2: partial(
+        regression_functions.polynomial_design_matrix, degree=2
+    ),
+    RegressionFunctionType.POLYNOMIAL_3: partial(
+        regression_functions.polynomial_design_matrix, degree=3
+    ),
+    RegressionFunctionType.POLYNOMIAL_4: partial(
+        regression_functions.polynomial_design_matrix, degree=4
+    ),
+}
+
+
+def is_linear_in_parameters(function_type: RegressionFunctionType) -> bool:
+    return function_type in LINEAR_DESIGN_MATRICES
+
+
+def fit(
+    function_type: RegressionFunctionType,
+    x_data: np.ndarray,
+    y_data: np.ndarray,
+    weights: np.ndarray | None = None,
+) -> np.ndarray:
+    # Weighted least squares when weights are given, e.g. bin counts.
+    x_data = np.asarray(x_data, dtype=np.float64)
+    y_data = np.asarray(y_data, dtype=np.float64)
+    if is_linear_in_parameters(function_type):
+        design_matrix = LINEAR_DESIGN_MATRICES[function_type](x_data)
+        if weights is not None:
+            row_scale = np.sqrt(weights)
+            design_matrix = design_matrix * row_scale[:, np.newaxis]
+            y_data = y_data * row_scale
+        params, *_ = np.linalg.lstsq(design_matrix, y_data, rcond=None)
+        return params
+    params, _ = scipy.optimize.curve_fit(
+        function_type.function,
+        x_data,
+        y_data,
+        p0=initial_guess(function_type, x_data, y_data, weights),
+        sigma=None if weights is None else 1 / np.sqrt(weights),
+    )
+    return params
+
+
+def bin_means(
+    bin_keys: np.ndarray, x_data: np.ndarray, y_data: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Mean x, mean y and count of every non-empty bin. A fit on the means
+    # weighted by the counts equals the full fit whenever x is constant within
+    # a bin, so narrow bins lose very little.
+    _, bins = np.unique(bin_keys, return_inverse=True)
+    bins = bins.reshape(-1)
+    counts = np.bincount(bins)
+    return (
+        np.bincount(bins, weights=x_data) / counts,
+        np.bincount(bins, weights=y_data) / counts,
+        counts,
+    )
+
+
+def initial_guess(
+    function_type: RegressionFunctionType,
+    x_data: np.ndarray,
+    y_data: np.ndarray,
+    weights: np.ndarray | None = None,
+) -> np.ndarray:
+    # Linearized versions of the non-linear models: log(a * exp(-b * x)) and
+    # log(a * x**-b) are straight lines in x and log(x), and the logarithmic
+    # model is already linear in a and b, so its guess is the exact solution.
+    match function_type:
+        case RegressionFunctionType.EXPONENTIAL:
+            valid = y_data > 0
+            design_matrix = regression_functions.linear_design_matrix(x_data[valid])
+            target = np.log(y_data[valid])
+        case RegressionFunctionType.POWER_LAW:
+            valid = (x_data > 0) & (y_data > 0)
+            design_matrix = regression_functions.linear_design_matrix(
+                np.log(x_data[valid])
+            )
+            target = np.log(y_data[valid])
+        case RegressionFunctionType.LOGARITHMIC:
+            valid = x_data > -1
+            design_matrix = regression_functions.logarithmic_design_matrix(
+                x_data[valid]
+            )
+            target = y_data[valid]
+        case _:
+            msg = f"No initial guess for {function_type}"
+            raise ValueError(msg)
+
+    if np.count_nonzero(valid) < design_matrix.shape[1]:
+        return np.ones(design_matrix.shape[1])
+
+    if weights is not None:
+        row_scale = np.sqrt(weights[valid])
+        design_matrix = design_matrix * row_scale[:, np.newaxis]
+        target = target * row_scale
+
+    params, *_ = np.linalg.lstsq(design_matrix, target, rcond=None)
+    if function_type is not RegressionFunctionType.LOGARITHMIC:
+        params[0] = np.exp(params[0])
+    return params
+
+
+def evaluate_curve(  # noqa: PLR0913
+    function_type: RegressionFunctionType,
+    params: np.ndarray,
+    x_min: float,
+    x_max: float,
+    *,
+    now: datetime.datetime,
+    points: int = 500,
+) -> tuple[np.ndarray, np.ndarray]:
+    x_curve = np.linspace(x_min, x_max, points)
+    y_curve = function_type.function(x_curve, *params)
+    offsets = np.rint(x_curve * DAYS_PER_YEAR * 86_400_000_000).astype(
+        "timedelta64[us]"
+    )
+    dates = (np.datetime64(now, "us") - offsets).astype(datetime.datetime)
+    return dates, y_curve
+
+
+def robust_z_scores(values: np.ndarray) -> np.ndarray:
+    # Distance from the median in scaled median absolute deviations, which a
+    # few extreme listings cannot drag around like the mean and the standard
+    # deviation. All zero when more than half of the values are equal.
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return values
+    median = np.median(values)
+    spread = MAD_SCALE * np.median(np.abs(values - median))
+    if spread == 0:
+        return np.zeros_like(values)
+    return (values - median) / spread
+
+
+def fit_groups(  # noqa: PLR0913
+    function_type: RegressionFunctionType,
+    group_codes: np.ndarray,
+    x_data: np.ndarray,
+    y_data: np.ndarray,
+    *,
+    min_group_size: int = 10,
+    max_workers: int | None = None,
+) -> dict[int, np.ndarray]:
+    # Fits one curve per group code and returns the parameters of every group
+    # with at least `min_group_size` cars. Groups whose fit fails are left out.
+    x_data = np.asarray(x_data, dtype=np.float64)
+    y_data = np.asarray(y_data, dtype=np.float64)
+    counts = np.bincount(group_codes)
+    members = np.argsort(group_codes, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    groups = np.flatnonzero(counts >= max(min_group_size, 1))
+
+    if is_linear_in_parameters(function_type):
+        return _fit_linear_groups(
+            function_type, x_data[members], y_data[members], starts, groups
+        )
+
+    if len(groups) == 0:
+        return {}
+
+    group_members = np.split(members, starts[1:])
+    arguments = [
+        (function_type, x_data[group_members[group]], y_data[group_members[group]])
+        for group in groups.tolist()
+    ]
+    with multiprocessing.Pool(max_workers) as pool:
+        params = pool.starmap(_fit_or_none, arguments)
+    return {
+        group: group_params
+        for group, group_params in zip(groups.tolist(), params, strict=True)
+        if group_params is not None
+    }
+
+
+def _fit_linear_groups(
+    function_type: RegressionFunctionType,
+    sorted_x: np.ndarray,
+    sorted_y: np.ndarray,
+    starts: np.ndarray,
+    groups: np.ndarray,
+) -> dict[int, np.ndarray]:
+    # Stacked least squares: the normal equations of every group are summed in
+    # one np.add.reduceat pass per matrix entry and solved as a batch. Ages are
+    # scaled to [0, 1] first to keep the higher polynomial powers conditioned.
+    scale = max(float(np.abs(sorted_x).max(initial=0.0)), 1.0)
+    design_matrix = LINEAR_DESIGN_MATRICES[function_type](sorted_x / scale)
+    parameter_count = design_matrix.shape[1]
+
+    gram = np.empty((len(starts), parameter_count, parameter_count))
+    for row in range(parameter_count):
+        for column in range(row, parameter_count):
+            gram[:, row, column] = np.add.reduceat(
+                design_matrix[:, row] * design_matrix[:, column], starts
+            )
+            gram[:, column, row] = gram[:, row, column]
+    moments = np.stack(
+        [
+            np.add.reduceat(design_matrix[:, column] * sorted_y, starts)
+            for column in range(parameter_count)
+        ],
+        axis=1,
+    )
+
+    params = np.einsum(
+        "gij,gj->gi", np.linalg.pinv(gram[groups], hermitian=True), moments[groups]
+    )
+    params /= scale ** np.arange(parameter_count)
+    return dict(zip(groups.tolist(), params, strict=True))
+
+
+def _fit_or_none(
+    function_type: RegressionFunctionType, x_data: np.ndarray, y_data: np.ndarray
+) -> np.ndarray | None:
+    try:
+        params = fit(function_type, x_data, y_data)
+    except (RuntimeError, ValueError, np.linalg.LinAlgError):
+        return None
+    return params if np.all(np.isfinite(params)) else None
+
+
+def fit_statistics(
+    function_type: RegressionFunctionType,
+    params: np.ndarray,
+    x_data: np.ndarray,
+    y_data: np.ndarray,
+) -> RegressionModelFit:
+    residuals = y_data - function_type.function(x_data, *params)
+    amount = len(y_data)
+    parameter_count = len(params)
+    rss = float(np.sum(residuals**2))
+    total_sum_of_squares = float(np.sum((y_data - y_data.mean()) ** 2))
+    # Gaussian log-likelihood up to a constant, shared by all models.
+    log_rss = amount * math.log(rss / amount) if rss > 0 else -math.inf
+    return RegressionModelFit(
+        function_type=function_type,
+        params=params.tolist(),
+        residual_sum_of_squares=rss,
+        root_mean_squared_error=math.sqrt(rss / amount),
+        r_squared=(
+            1 - rss / total_sum_of_squares if total_sum_of_squares > 0 else math.nan
+        ),
+        aic=log_rss + 2 * parameter_count,
+        bic=log_rss + parameter_count * math.log(amount),
+    )
+
+
+def _fit_with_statistics(
+    function_type: RegressionFunctionType, x_data: np.ndarray, y_data: np.ndarray
+) -> RegressionModelFit:
+    params = fit(function_type, x_data, y_data)
+    if not np.all(np.isfinite(params)):
+        msg = "fit did not converge to finite parameters"
+        raise ValueError(msg)
+    return fit_statistics(function_type, params, x_data, y_data)
+
+
+def _failed_fit(
+    function_type: RegressionFunctionType, error: str
+) -> RegressionModelFit:
+    return RegressionModelFit(
+        function_type=function_type,
+        params=[],
+        residual_sum_of_squares=math.inf,
+        root_mean_squared_error=math.inf,
+        r_squared=math.nan,
+        aic=math.inf,
+        bic=math.inf,
+        error=error,
+    )
+
+
+def fit_all_models(
+    x_data: np.ndarray,
+    y_data: np.ndarray,
+    timeout: float = 10.0,
+    max_workers: int | None = None,
+) -> list[RegressionModelFit]:
+    # Every model runs in its own worker process and gets `timeout` seconds of
+    # wall-clock time from submission. Models that fail or run out of time are
+    # reported with their error, and the pool is terminated so a stuck fit
+    # does not keep running in the background.
+    x_data = np.asarray(x_data, dtype=np.float64)
+    y_data = np.asarray(y_data, dtype=np.float64)
+    function_types = list(RegressionFunctionType)
+
+    pool = multiprocessing.Pool(max_workers or len(function_types))
+    try:
+        pending = [
+            pool.apply_async(_fit_with_statistics, (function_type, x_data, y_data))
+            for function_type in function_types
+        ]
+        deadline = time.monotonic() + timeout
+        fits = []
+        for function_type, result in zip(function_types, pending, strict=True):
+            try:
+                fits.append(result.get(max(0.0, deadline - time.monotonic())))
+            except multiprocessing.TimeoutError:
+                fits.append(
+                    _failed_fit(function_type, f"fit exceeded {timeout} seconds")
+                )
+            except Exception as exception:  # noqa: BLE001
+                fits.append(_failed_fit(function_type, str(exception)))
+    finally:
+        pool.terminate()
+        pool.join()
+
+    successful_fits = [fit for fit in fits if fit.error is None]
+    if successful_fits:
+        min(successful_fits, key=lambda fit: fit.aic).best = True
+    return fits
@@ -27,3 +27,19 @@ def polynomial_3_depreciation(x, a, b, c, d):  # noqa: ANN001, ANN202
 
 def polynomial_4_depreciation(x, a, b, c, d, e):  # noqa: ANN001, ANN202, PLR0913
     return a - b * x + c * (x**2) + d * (x**3) + e * (x**4)
+
+
+# Design matrices of the functions that are linear in their parameters. Their
+# columns line up with the parameters, so least squares solves them directly.
+def linear_design_matrix(x):  # noqa: ANN001, ANN202
+    return np.column_stack((np.ones_like(x), -x))
+
+
+def logarithmic_design_matrix(x):  # noqa: ANN001, ANN202
+    return np.column_stack((np.ones_like(x), -np.log(1 + x)))
+
+
+def polynomial_design_matrix(x, degree):  # noqa: ANN001, ANN202
+    return np.column_stack(
+        (np.ones_like(x), -x, *(x**power for power in range(2, degree + 1)))
+    )
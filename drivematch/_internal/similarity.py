@@ -0,0 +1,41 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class SimilarityIndex:
+    # One KD-tree per group over the rows of `features` (one row per car),
+    # so neighbours always share the group of the car they are queried for.
+    def __init__(self, features: np.ndarray, group_codes: np.ndarray) -> None:
+        self.features = features
+        self.group_codes = group_codes
+        members = np.argsort(group_codes, kind="stable")
+        boundaries = np.cumsum(np.bincount(group_codes))[:-1]
+        self.group_members = np.split(members, boundaries) if len(members) else []
+        self.trees = [cKDTree(features[rows]) for rows in self.group_members]
+
+    def query(self, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        # The k nearest other cars of every queried row, closest first, as
+        # row indices and distances. Groups with fewer cars pad the result
+        # with -1 and inf. Queries are answered one batch per group.
+        rows = np.asarray(rows, dtype=np.intp)
+        neighbours = np.full((len(rows), k), -1, dtype=np.intp)
+        distances = np.full((len(rows), k), np.inf)
+        query_groups = self.group_codes[rows]
+        for group in np.unique(query_groups).tolist():
+            queries = np.flatnonzero(query_groups == group)
+            members = self.group_members[group]
+            group_distances, positions = self.trees[group].query(
+                self.features[rows[queries]], k=k + 1
+            )
+            found = positions < len(members)
+            group_neighbours = np.where(
+                found, members[np.minimum(positions, len(members) - 1)], -1
+            )
+            # Drops the queried car itself, or the farthest neighbour when a
+            # duplicate of the car was returned in its place.
+            is_self = group_neighbours == rows[queries, np.newaxis]
+            is_self[~is_self.any(axis=1), -1] = True
+            keep = ~is_self
+            neighbours[queries] = group_neighbours[keep].reshape(len(queries), k)
+            distances[queries] = group_distances[keep].reshape(len(queries), k)
+        return neighbours, distances
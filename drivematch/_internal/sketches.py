@@ -0,0 +1,83 @@
+import json
+
+import numpy as np
+
+
+class QuantileSketch:
+    # KLL sketch: values are kept in levels whose items stand for 2**level
+    # values each. A level over its capacity is sorted and every other item,
+    # starting at a random offset, moves up a level. Capacities shrink by 2/3
+    # per level below the top, so the sketch holds O(k) items and answers
+    # quantiles within a rank error of roughly 2 / k. Sketches merge by
+    # concatenating their levels and compacting again.
+    def __init__(self, k: int = 200, seed: int = 0) -> None:
+        self.k = k
+        self.levels: list[np.ndarray] = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    @property
+    def count(self) -> int:
+        return sum(len(items) << level for level, items in enumerate(self.levels))
+
+    def add(self, values: np.ndarray) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self._compact()
+
+    def merge(self, other: "QuantileSketch") -> None:
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate((self.levels[level], items))
+        self._compact()
+
+    def quantiles(self, probabilities: list[float]) -> list[float]:
+        # The smallest value whose estimated cumulative share reaches each
+        # probability, like np.percentile with method="inverted_cdf".
+        if self.count == 0:
+            return [np.nan] * len(probabilities)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate(
+            [np.full(len(items), 1 << level) for level, items in enumerate(self.levels)]
+        )
+        order = np.argsort(values, kind="stable")
+        cumulative_weights = np.cumsum(weights[order])
+        positions = np.searchsorted(
+            cumulative_weights, np.asarray(probabilities) * self.count
+        )
+        return values[order][np.minimum(positions, len(values) - 1)].tolist()
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - 1 - level
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compact(self) -> None:
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) <= self._capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(self.levels[level])
+            # An odd item out stays behind, so the promoted items pair up.
+            kept = len(items) % 2
+            promoted = items[kept:][self.rng.integers(2) :: 2]
+            self.levels[level] = items[:kept]
+            self.levels[level + 1] = np.concatenate((self.levels[level + 1], promoted))
+            # A new top level lowers the capacity of every level below it.
+            level = 0
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {"k": self.k, "levels": [items.tolist() for items in self.levels]}
+        )
+
+    @classmethod
+    def from_json(cls, data: str) -> "QuantileSketch":
+        values = json.loads(data)
+        sketch = cls(values["k"])
+        sketch.levels = [
+            np.array(items, dtype=np.float64) for items in values["levels"]
+        ]
+        return sketch
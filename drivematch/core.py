@@ -1,14 +1,32 @@
 import datetime
+import json
 import logging
+import threading
 import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+import numpy as np
 
 from drivematch._internal.analysis import CarsAnalyzer
 from drivematch._internal.db import Search, SearchesRepository, SQLiteSearchesRepository
 from drivematch._internal.scraping import CarsScraper, MobileDeScraper
+from drivematch._internal.sketches import QuantileSketch
 from drivematch.types import (
+    BatchScores,
+    BinnedRegressionDeviation,
+    Car,
+    CarFrame,
+    DealCar,
     GroupedCarsByManufacturerAndModel,
+    GroupedQuantiles,
+    GroupedRegressionLine,
+    MarketTrend,
+    PriceHistories,
     RegressionFunctionType,
+    RegressionModelFit,
     ScoredCar,
+    SimilarCar,
 )
 
 logger = logging.getLogger(__name__)
@@ -24,6 +42,16 @@ class DriveMatchService:
         self.searches_repository = searches_repository
         self.cars_scraper = cars_scraper
         self.cars_analyzer = cars_analyzer
+        self.loaded_search_id: str | None = None
+        self.loaded_fingerprint: str | None = None
+        self.loaded_searches_version: str | None = None
+        # Held while a search is loaded and analyzed, as requests may come from
+        # several threads and the analyzer keeps the loaded search and its
+        # weights and filters between calls.
+        self.analysis_lock = threading.Lock()
+        self.all_searches_analyzer = CarsAnalyzer()
+        self.all_searches_fingerprint: str | None = None
+        self.all_searches_version: str | None = None
 
     def scrape(self, name: str, url: str) -> None:
         logger.info("Scraping with name=%s and url=%s", name, url)
@@ -48,48 +76,297 @@ class DriveMatchService:
         preferred_advertisement_age: float,
         filter_by_manufacturers: list[str],
         filter_by_models: list[str],
+        limit: int | None = None,
+        offset: int = 0,
+        *,
+        normalize_over_filtered: bool = False,
+        weight_deal: float = 0.0,
+        deal_function_type: RegressionFunctionType = RegressionFunctionType.EXPONENTIAL,
+        filter_by_attributes: list[str] = [],
     ) -> list[ScoredCar]:
         logger.info("Getting scores for search search_id=%s", search_id)
-        cars = self.searches_repository.get_cars_for_search(search_id)
-        self.cars_analyzer.set_cars(cars)
-        self.cars_analyzer.set_weights_and_filters(
-            weight_horsepower,
-            weight_price,
-            weight_mileage,
-            weight_age,
-            preferred_age,
-            weight_advertisement_age,
-            preferred_advertisement_age,
-            filter_by_manufacturers,
-            filter_by_models,
+        with self._loaded_search(search_id):
+            self.cars_analyzer.set_weights_and_filters(
+                weight_horsepower,
+                weight_price,
+                weight_mileage,
+                weight_age,
+                preferred_age,
+                weight_advertisement_age,
+                preferred_advertisement_age,
+                filter_by_manufacturers,
+                filter_by_models,
+                normalize_over_filtered=normalize_over_filtered,
+                weight_deal=weight_deal,
+                deal_function_type=deal_function_type,
+                filter_by_attributes=filter_by_attributes,
+            )
+            return self.cars_analyzer.get_scored_cars(limit, offset)
+
+    def get_batch_scores(  # noqa: PLR0913
+        self,
+        search_id: str,
+        weight_matrix: np.ndarray,
+        preferred_age: float,
+        preferred_advertisement_age: float,
+        filter_by_manufacturers: list[str],
+        filter_by_models: list[str],
+        top_k: int | None = None,
+        *,
+        deal_function_type: RegressionFunctionType = RegressionFunctionType.EXPONENTIAL,
+        filter_by_attributes: list[str] = [],
+    ) -> BatchScores:
+        logger.info(
+            "Getting scores of %d weight vectors for search search_id=%s",
+            len(weight_matrix),
+            search_id,
         )
-        return self.cars_analyzer.get_scored_cars()
+        with self._loaded_search(search_id):
+            self.cars_analyzer.set_weights_and_filters(
+                0.0,
+                0.0,
+                0.0,
+                0.0,
+                preferred_age,
+                0.0,
+                preferred_advertisement_age,
+                filter_by_manufacturers,
+                filter_by_models,
+                deal_function_type=deal_function_type,
+                filter_by_attributes=filter_by_attributes,
+            )
+            return self.cars_analyzer.get_batch_scores(weight_matrix, top_k)
+
+    def get_deals(
+        self,
+        search_id: str,
+        function_type: RegressionFunctionType,
+        threshold: float = 2.0,
+        filter_by_manufacturers: list[str] = [],
+        filter_by_models: list[str] = [],
+    ) -> list[DealCar]:
+        logger.info("Getting deals for search search_id=%s", search_id)
+        with self._loaded_search(search_id):
+            return self.cars_analyzer.get_deals(
+                function_type, threshold, filter_by_manufacturers, filter_by_models
+            )
+
+    def get_similar_cars(
+        self, search_id: str | None, car_ids: list[str], k: int = 10
+    ) -> list[list[SimilarCar]]:
+        # Without a search ID, neighbours are looked up across all searches.
+        logger.info("Getting similar cars for search search_id=%s", search_id)
+        if search_id is not None:
+            with self._loaded_search(search_id):
+                return self.cars_analyzer.get_similar_cars(car_ids, k)
+        with self.analysis_lock:
+            return self._all_searches_analyzer().get_similar_cars(car_ids, k)
+
+    def _all_searches_analyzer(self) -> CarsAnalyzer:
+        # A second analyzer over the cars of every search, rebuilt once any
+        # search was added or changed. A car listed in several searches is
+        # kept once, as of its latest search.
+        searches_version = self.searches_repository.get_searches_version()
+        if searches_version != self.all_searches_version:
+            fingerprint = self.searches_repository.get_fingerprint_for_all_searches()
+            if fingerprint != self.all_searches_fingerprint:
+                frame = CarFrame.concatenate(
+                    [
+                        self.searches_repository.get_car_frame_for_search(search.id)
+                        for search in self.searches_repository.get_searches()
+                    ]
+                )
+                # The last row of every ID, in the order of its first one.
+                ids = np.array(frame.ids, dtype=object)
+                _, first_rows, inverse = np.unique(
+                    ids, return_index=True, return_inverse=True
+                )
+                last_rows = np.zeros(len(first_rows), dtype=np.intp)
+                np.maximum.at(last_rows, inverse, np.arange(len(ids)))
+                self.all_searches_analyzer = CarsAnalyzer(
+                    frame.take(last_rows[np.argsort(first_rows)])
+                )
+                self.all_searches_fingerprint = fingerprint
+            self.all_searches_version = searches_version
+        self.all_searches_analyzer.set_as_of(self.cars_analyzer.as_of)
+        return self.all_searches_analyzer
+
+    def get_pareto_front(
+        self,
+        search_id: str,
+        filter_by_manufacturers: list[str] = [],
+        filter_by_models: list[str] = [],
+    ) -> list[Car]:
+        logger.info("Getting pareto front for search search_id=%s", search_id)
+        with self._loaded_search(search_id):
+            return self.cars_analyzer.get_pareto_front(
+                filter_by_manufacturers, filter_by_models
+            )
 
     def get_groups(
         self,
         search_id: str,
+        *,
+        include_cars: bool = True,
+        streaming: bool = False,
     ) -> list[GroupedCarsByManufacturerAndModel]:
         logger.info("Getting groups for search search_id=%s", search_id)
-        cars = self.searches_repository.get_cars_for_search(search_id)
-        self.cars_analyzer.set_cars(cars)
-        return self.cars_analyzer.get_grouped_cars()
+        if streaming:
+            # Reads the search in batches instead of loading it, for searches
+            # too large to keep in memory. Groups come without cars.
+            return self.cars_analyzer.get_streamed_grouped_cars(
+                self.searches_repository.iter_car_frames_for_search(search_id)
+            )
+        with self._loaded_search(search_id):
+            return self.cars_analyzer.get_grouped_cars(include_cars=include_cars)
+
+    def get_group_quantiles(
+        self, search_ids: list[str], quantiles: list[float] = [0.1, 0.5, 0.9]
+    ) -> list[GroupedQuantiles]:
+        # Quantiles per group across the given searches, answered by merging
+        # the persisted sketches of every search instead of reading its cars.
+        logger.info("Getting group quantiles for searches search_ids=%s", search_ids)
+        merged: dict[tuple[str, str], dict[str, QuantileSketch]] = {}
+        for search_id in search_ids:
+            for key, metric_sketches in self._quantile_sketches(search_id).items():
+                if key not in merged:
+                    merged[key] = metric_sketches
+                    continue
+                for metric, sketch in metric_sketches.items():
+                    merged[key][metric].merge(sketch)
+        return self.cars_analyzer.summarize_quantile_sketches(merged, quantiles)
+
+    def _quantile_sketches(
+        self, search_id: str
+    ) -> dict[tuple[str, str], dict[str, QuantileSketch]]:
+        fingerprint = self.searches_repository.get_fingerprint_for_search(search_id)
+        sketches = self.searches_repository.get_quantile_sketches(
+            search_id, fingerprint
+        )
+        if sketches is None:
+            logger.info("Building quantile sketches for search search_id=%s", search_id)
+            with self._loaded_search(search_id):
+                sketches = self.cars_analyzer.get_quantile_sketches()
+            self.searches_repository.save_quantile_sketches(
+                search_id, fingerprint, sketches
+            )
+        return sketches
+
+    def get_price_histories(self, car_ids: list[str] | None = None) -> PriceHistories:
+        logger.info("Getting price histories")
+        return self.searches_repository.get_price_histories(car_ids)
+
+    def get_market_trends(
+        self,
+        search_name: str,
+        filter_by_manufacturers: list[str] = [],
+        filter_by_models: list[str] = [],
+    ) -> list[MarketTrend]:
+        logger.info("Getting market trends for search name=%s", search_name)
+        return self.searches_repository.get_market_trends(
+            search_name, filter_by_manufacturers, filter_by_models
+        )
 
     def get_searches(self) -> list[Search]:
         logger.info("Getting searches")
         return self.searches_repository.get_searches()
 
     def get_regression_line(
-        self, search_id: str, function_type: RegressionFunctionType
+        self,
+        search_id: str,
+        function_type: RegressionFunctionType,
+        bin_days: int | None = None,
+        filter_by_manufacturers: list[str] = [],
+        filter_by_models: list[str] = [],
     ) -> tuple[list[datetime.datetime], list[float]]:
         logger.info("Getting regression line for search search_id=%s", search_id)
-        cars = self.searches_repository.get_cars_for_search(search_id)
-        self.cars_analyzer.set_cars(cars)
-        return self.cars_analyzer.get_regression_line(function_type)
+        filter_key = json.dumps(
+            {
+                "bin_days": bin_days,
+                "manufacturers": sorted({m.lower() for m in filter_by_manufacturers}),
+                "models": sorted({m.lower() for m in filter_by_models}),
+            }
+        )
+        fingerprint = self.searches_repository.get_fingerprint_for_search(search_id)
+        parameters = self.searches_repository.get_regression_parameters(
+            search_id, function_type, filter_key, fingerprint
+        )
+        if parameters is None:
+            logger.info("Fitting regression for search search_id=%s", search_id)
+            with self._loaded_search(search_id):
+                parameters = self.cars_analyzer.fit_regression_parameters(
+                    function_type, bin_days, filter_by_manufacturers, filter_by_models
+                )
+            if parameters is None:
+                return [], []
+            self.searches_repository.save_regression_parameters(
+                search_id, filter_key, fingerprint, parameters
+            )
+        return self.cars_analyzer.get_regression_curve(parameters)
+
+    def compare_binned_regression(
+        self, search_id: str, function_type: RegressionFunctionType, bin_days: int
+    ) -> BinnedRegressionDeviation:
+        logger.info("Comparing binned regression for search search_id=%s", search_id)
+        with self._loaded_search(search_id):
+            return self.cars_analyzer.compare_binned_regression(function_type, bin_days)
+
+    def get_grouped_regression_lines(
+        self,
+        search_id: str,
+        function_type: RegressionFunctionType,
+        min_group_size: int = 10,
+    ) -> list[GroupedRegressionLine]:
+        logger.info(
+            "Getting grouped regression lines for search search_id=%s", search_id
+        )
+        with self._loaded_search(search_id):
+            return self.cars_analyzer.get_grouped_regression_lines(
+                function_type, min_group_size
+            )
+
+    def fit_all_models(
+        self, search_id: str, timeout: float = 10.0
+    ) -> list[RegressionModelFit]:
+        logger.info("Fitting all regression models for search search_id=%s", search_id)
+        with self._loaded_search(search_id):
+            return self.cars_analyzer.fit_all_models(timeout)
+
+    @contextmanager
+    def _loaded_search(self, search_id: str) -> Iterator[None]:
+        # Loads the search into the analyzer and holds the analysis lock for
+        # the block. The analyzer keeps its frame and cached feature matrix
+        # while the same search is analyzed again, e.g. for every weight change
+        # in the UI, unless its cars changed since, also by another process.
+        # The fingerprint is only compared once any search was stored since.
+        with self.analysis_lock:
+            searches_version = self.searches_repository.get_searches_version()
+            if (search_id, searches_version) != (
+                self.loaded_search_id,
+                self.loaded_searches_version,
+            ):
+                fingerprint = self.searches_repository.get_fingerprint_for_search(
+                    search_id
+                )
+                if (search_id, fingerprint) != (
+                    self.loaded_search_id,
+                    self.loaded_fingerprint,
+                ):
+                    car_frame = self.searches_repository.get_car_frame_for_search(
+                        search_id
+                    )
+                    self.cars_analyzer.set_cars(car_frame)
+                    self.loaded_search_id = search_id
+                    self.loaded_fingerprint = fingerprint
+                self.loaded_searches_version = searches_version
+            yield
 
 
-def create_default_drivematch_service(db_path: str) -> DriveMatchService:
+def create_default_drivematch_service(
+    db_path: str, *, concurrent: bool = False
+) -> DriveMatchService:
     return DriveMatchService(
-        SQLiteSearchesRepository(db_path),
+        SQLiteSearchesRepository(db_path, concurrent=concurrent),
         MobileDeScraper(),
         CarsAnalyzer(),
     )
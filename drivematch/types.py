@@ -1,8 +1,10 @@
 import datetime
-from collections.abc import Callable
-from dataclasses import dataclass
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass, replace
 from enum import Enum
 
+import numpy as np
+
 from drivematch._internal import regression_functions
 
 
@@ -34,12 +36,433 @@ class Car:
     image_url: str
 
 
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def epoch_day(moment: datetime.date) -> int:
+    # Days since 1970-01-01 of the calendar day of a date or datetime.
+    return moment.toordinal() - EPOCH_ORDINAL
+
+
+def _dictionary_encode(values: Sequence[str]) -> tuple[np.ndarray, list[str]]:
+    categories: dict[str, int] = {}
+    codes = np.fromiter(
+        (categories.setdefault(value, len(categories)) for value in values),
+        dtype=np.int32,
+        count=len(values),
+    )
+    return codes, list(categories)
+
+
+def _encode_attributes(
+    attributes: Sequence[list[str]],
+) -> tuple[np.ndarray, np.ndarray, list[str]]:
+    # Offsets, codes and names of CarFrame's attribute columns.
+    offsets = np.zeros(len(attributes) + 1, dtype=np.intp)
+    np.cumsum([len(names) for names in attributes], out=offsets[1:])
+    codes, names = _dictionary_encode([name for names in attributes for name in names])
+    return offsets, codes, names
+
+
+def _concatenate_codes(
+    codes: list[np.ndarray], categories: list[list[str]]
+) -> tuple[np.ndarray, list[str]]:
+    # Maps the codes of every part into the categories of all parts, which
+    # stay ordered by first appearance when the parts are concatenated.
+    category_codes, all_categories = _dictionary_encode(
+        [category for part in categories for category in part]
+    )
+    starts = np.cumsum([0] + [len(part) for part in categories[:-1]])
+    return (
+        np.concatenate(
+            [
+                category_codes[start + part_codes]
+                for start, part_codes in zip(starts.tolist(), codes, strict=True)
+            ]
+        ),
+        all_categories,
+    )
+
+
+def _epoch_days(dates: np.ndarray) -> np.ndarray:
+    # Casting to whole days floors, like epoch_day() does for dates before 1970.
+    return dates.astype("datetime64[D]").astype(np.int64)
+
+
+# Struct-of-arrays counterpart of list[Car]. Manufacturer, model and fuel type
+# are stored as codes into category lists ordered by first appearance, and Car
+# objects are only created on demand by car() and to_cars(). Attributes are
+# codes into attribute_names, those of car i at attribute_offsets[i] up to
+# attribute_offsets[i + 1]. Registration and advertisement dates are also kept
+# as epoch days, so ages are one integer subtraction.
+@dataclass
+class CarFrame:
+    ids: list[str]
+    timestamps: np.ndarray
+    manufacturer_codes: np.ndarray
+    manufacturers: list[str]
+    model_codes: np.ndarray
+    models: list[str]
+    descriptions: list[str]
+    prices: np.ndarray
+    attribute_offsets: np.ndarray
+    attribute_codes: np.ndarray
+    attribute_names: list[str]
+    first_registrations: np.ndarray
+    first_registration_days: np.ndarray
+    mileages: np.ndarray
+    horse_powers: np.ndarray
+    fuel_type_codes: np.ndarray
+    fuel_types: list[str]
+    advertised_sinces: np.ndarray
+    advertised_since_days: np.ndarray
+    private_sellers: np.ndarray
+    details_urls: list[str]
+    image_urls: list[str]
+
+    @classmethod
+    def from_columns(  # noqa: PLR0913
+        cls,
+        *,
+        ids: Sequence[str],
+        timestamps: Sequence,
+        manufacturers: Sequence[str],
+        models: Sequence[str],
+        descriptions: Sequence[str],
+        prices: Sequence[int],
+        attribute_offsets: np.ndarray,
+        attribute_codes: np.ndarray,
+        attribute_names: list[str],
+        first_registrations: Sequence,
+        mileages: Sequence[int],
+        horse_powers: Sequence[int],
+        fuel_types: Sequence[str],
+        advertised_sinces: Sequence,
+        private_sellers: Sequence[bool],
+        details_urls: Sequence[str],
+        image_urls: Sequence[str],
+    ) -> "CarFrame":
+        manufacturer_codes, manufacturer_categories = _dictionary_encode(manufacturers)
+        model_codes, model_categories = _dictionary_encode(models)
+        fuel_type_codes, fuel_type_categories = _dictionary_encode(fuel_types)
+        first_registrations = np.array(first_registrations, dtype="datetime64[us]")
+        advertised_sinces = np.array(advertised_sinces, dtype="datetime64[us]")
+        return cls(
+            ids=list(ids),
+            timestamps=np.array(timestamps, dtype="datetime64[us]"),
+            manufacturer_codes=manufacturer_codes,
+            manufacturers=manufacturer_categories,
+            model_codes=model_codes,
+            models=model_categories,
+            descriptions=list(descriptions),
+            prices=np.array(prices, dtype=np.int64),
+            attribute_offsets=np.asarray(attribute_offsets, dtype=np.intp),
+            attribute_codes=np.asarray(attribute_codes, dtype=np.int32),
+            attribute_names=list(attribute_names),
+            first_registrations=first_registrations,
+            first_registration_days=_epoch_days(first_registrations),
+            mileages=np.array(mileages, dtype=np.int64),
+            horse_powers=np.array(horse_powers, dtype=np.int64),
+            fuel_type_codes=fuel_type_codes,
+            fuel_types=fuel_type_categories,
+            advertised_sinces=advertised_sinces,
+            advertised_since_days=_epoch_days(advertised_sinces),
+            private_sellers=np.array(private_sellers, dtype=np.bool_),
+            details_urls=list(details_urls),
+            image_urls=list(image_urls),
+        )
+
+    @classmethod
+    def from_cars(cls, cars: list[Car]) -> "CarFrame":
+        attribute_offsets, attribute_codes, attribute_names = _encode_attributes(
+            [car.attributes for car in cars]
+        )
+        return cls.from_columns(
+            ids=[car.id for car in cars],
+            timestamps=[car.timestamp for car in cars],
+            manufacturers=[car.manufacturer for car in cars],
+            models=[car.model for car in cars],
+            descriptions=[car.description for car in cars],
+            prices=[car.price for car in cars],
+            attribute_offsets=attribute_offsets,
+            attribute_codes=attribute_codes,
+            attribute_names=attribute_names,
+            first_registrations=[car.first_registration for car in cars],
+            mileages=[car.mileage for car in cars],
+            horse_powers=[car.horse_power for car in cars],
+            fuel_types=[car.fuel_type for car in cars],
+            advertised_sinces=[car.advertised_since for car in cars],
+            private_sellers=[car.private_seller for car in cars],
+            details_urls=[car.details_url for car in cars],
+            image_urls=[car.image_url for car in cars],
+        )
+
+    @classmethod
+    def concatenate(cls, frames: list["CarFrame"]) -> "CarFrame":
+        # The rows of all frames in order, without creating Car objects.
+        if not frames:
+            return cls.from_cars([])
+        manufacturer_codes, manufacturers = _concatenate_codes(
+            [frame.manufacturer_codes for frame in frames],
+            [frame.manufacturers for frame in frames],
+        )
+        model_codes, models = _concatenate_codes(
+            [frame.model_codes for frame in frames],
+            [frame.models for frame in frames],
+        )
+        fuel_type_codes, fuel_types = _concatenate_codes(
+            [frame.fuel_type_codes for frame in frames],
+            [frame.fuel_types for frame in frames],
+        )
+        attribute_codes, attribute_names = _concatenate_codes(
+            [frame.attribute_codes for frame in frames],
+            [frame.attribute_names for frame in frames],
+        )
+        attribute_starts = np.cumsum(
+            [0] + [len(frame.attribute_codes) for frame in frames[:-1]]
+        )
+        return cls(
+            ids=[car_id for frame in frames for car_id in frame.ids],
+            timestamps=np.concatenate([frame.timestamps for frame in frames]),
+            manufacturer_codes=manufacturer_codes,
+            manufacturers=manufacturers,
+            model_codes=model_codes,
+            models=models,
+            descriptions=[
+                description for frame in frames for description in frame.descriptions
+            ],
+            prices=np.concatenate([frame.prices for frame in frames]),
+            attribute_offsets=np.concatenate(
+                [np.zeros(1, dtype=np.intp)]
+                + [
+                    frame.attribute_offsets[1:] + start
+                    for start, frame in zip(
+                        attribute_starts.tolist(), frames, strict=True
+                    )
+                ]
+            ),
+            attribute_codes=attribute_codes,
+            attribute_names=attribute_names,
+            first_registrations=np.concatenate(
+                [frame.first_registrations for frame in frames]
+            ),
+            first_registration_days=np.concatenate(
+                [frame.first_registration_days for frame in frames]
+            ),
+            mileages=np.concatenate([frame.mileages for frame in frames]),
+            horse_powers=np.concatenate([frame.horse_powers for frame in frames]),
+            fuel_type_codes=fuel_type_codes,
+            fuel_types=fuel_types,
+            advertised_sinces=np.concatenate(
+                [frame.advertised_sinces for frame in frames]
+            ),
+            advertised_since_days=np.concatenate(
+                [frame.advertised_since_days for frame in frames]
+            ),
+            private_sellers=np.concatenate([frame.private_sellers for frame in frames]),
+            details_urls=[url for frame in frames for url in frame.details_urls],
+            image_urls=[url for frame in frames for url in frame.image_urls],
+        )
+
+    def take(self, indices: list[int] | np.ndarray) -> "CarFrame":
+        # The given rows as a frame of their own. The categories are kept, so
+        # they may include some that none of these rows has.
+        indices = np.asarray(indices, dtype=np.intp)
+        attribute_offsets, attribute_positions = self._attribute_positions(indices)
+        return replace(
+            self,
+            ids=[self.ids[index] for index in indices.tolist()],
+            timestamps=self.timestamps[indices],
+            manufacturer_codes=self.manufacturer_codes[indices],
+            model_codes=self.model_codes[indices],
+            descriptions=[self.descriptions[index] for index in indices.tolist()],
+            prices=self.prices[indices],
+            attribute_offsets=attribute_offsets,
+            attribute_codes=self.attribute_codes[attribute_positions],
+            first_registrations=self.first_registrations[indices],
+            first_registration_days=self.first_registration_days[indices],
+            mileages=self.mileages[indices],
+            horse_powers=self.horse_powers[indices],
+            fuel_type_codes=self.fuel_type_codes[indices],
+            advertised_sinces=self.advertised_sinces[indices],
+            advertised_since_days=self.advertised_since_days[indices],
+            private_sellers=self.private_sellers[indices],
+            details_urls=[self.details_urls[index] for index in indices.tolist()],
+            image_urls=[self.image_urls[index] for index in indices.tolist()],
+        )
+
+    def _attribute_positions(
+        self, indices: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # Offsets of the attributes of the given rows among each other, and
+        # where they are in attribute_codes.
+        counts = np.diff(self.attribute_offsets)[indices]
+        offsets = np.zeros(len(indices) + 1, dtype=np.intp)
+        np.cumsum(counts, out=offsets[1:])
+        positions = np.arange(offsets[-1]) + np.repeat(
+            self.attribute_offsets[indices] - offsets[:-1], counts
+        )
+        return offsets, positions
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def car(self, index: int) -> Car:
+        return self.to_cars([index])[0]
+
+    def to_cars(self, indices: list[int] | np.ndarray | None = None) -> list[Car]:
+        if indices is None:
+            indices = range(len(self))
+        indices = np.asarray(indices, dtype=np.intp)
+        manufacturer_codes = self.manufacturer_codes[indices].tolist()
+        model_codes = self.model_codes[indices].tolist()
+        fuel_type_codes = self.fuel_type_codes[indices].tolist()
+        # Only the attributes of the selected rows are converted to a list.
+        attribute_offsets, attribute_positions = self._attribute_positions(indices)
+        attribute_starts = attribute_offsets[:-1].tolist()
+        attribute_ends = attribute_offsets[1:].tolist()
+        attribute_codes = self.attribute_codes[attribute_positions].tolist()
+        return [
+            Car(
+                id=self.ids[index],
+                timestamp=timestamp,
+                manufacturer=self.manufacturers[manufacturer_code],
+                model=self.models[model_code],
+                description=self.descriptions[index],
+                price=price,
+                attributes=[
+                    self.attribute_names[code]
+                    for code in attribute_codes[attribute_start:attribute_end]
+                ],
+                first_registration=first_registration,
+                mileage=mileage,
+                horse_power=horse_power,
+                fuel_type=self.fuel_types[fuel_type_code],
+                advertised_since=advertised_since,
+                private_seller=private_seller,
+                details_url=self.details_urls[index],
+                image_url=self.image_urls[index],
+            )
+            for (
+                index,
+                timestamp,
+                manufacturer_code,
+                model_code,
+                price,
+                first_registration,
+                mileage,
+                horse_power,
+                fuel_type_code,
+                advertised_since,
+                private_seller,
+                attribute_start,
+                attribute_end,
+            ) in zip(
+                indices.tolist(),
+                self.timestamps[indices].tolist(),
+                manufacturer_codes,
+                model_codes,
+                self.prices[indices].tolist(),
+                self.first_registrations[indices].tolist(),
+                self.mileages[indices].tolist(),
+                self.horse_powers[indices].tolist(),
+                fuel_type_codes,
+                self.advertised_sinces[indices].tolist(),
+                self.private_sellers[indices].tolist(),
+                attribute_starts,
+                attribute_ends,
+                strict=True,
+            )
+        ]
+
+    def group_codes(self) -> tuple[np.ndarray, list[tuple[str, str]]]:
+        # Codes every car by its (manufacturer, model) pair, numbering the
+        # groups in order of first appearance, and the pair of every group.
+        pair_codes = (
+            self.manufacturer_codes.astype(np.int64) * len(self.models)
+            + self.model_codes
+        )
+        _, first_indices, inverse = np.unique(
+            pair_codes, return_index=True, return_inverse=True
+        )
+        appearance_order = np.argsort(first_indices)
+        group_of_unique = np.empty_like(appearance_order)
+        group_of_unique[appearance_order] = np.arange(len(appearance_order))
+        group_keys = [
+            (
+                self.manufacturers[self.manufacturer_codes[index]],
+                self.models[self.model_codes[index]],
+            )
+            for index in first_indices[appearance_order].tolist()
+        ]
+        return group_of_unique[inverse.reshape(-1)], group_keys
+
+    def attribute_mask(self, required_attributes: list[str]) -> np.ndarray:
+        # Cars that have every required attribute, compared case-insensitively.
+        # Works on the codes, so no Car objects are created.
+        mask = np.ones(len(self), dtype=np.bool_)
+        rows = np.repeat(np.arange(len(self)), np.diff(self.attribute_offsets))
+        lowercase_names = np.array(
+            [name.lower() for name in self.attribute_names], dtype=object
+        )
+        for name in {name.lower() for name in required_attributes}:
+            has_name = (lowercase_names == name)[self.attribute_codes]
+            mask &= np.bincount(rows[has_name], minlength=len(self)) > 0
+        return mask
+
+
+# Every scrape of a set of listings across all searches, ordered by car and
+# time. The scrapes of car_ids[i] are the rows offsets[i]:offsets[i + 1] of
+# timestamps, prices and mileages. Days on market count from the first
+# advertisement date to the latest scrape.
+@dataclass
+class PriceHistories:
+    car_ids: list[str]
+    offsets: np.ndarray
+    timestamps: np.ndarray
+    prices: np.ndarray
+    mileages: np.ndarray
+    days_on_market: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.car_ids)
+
+
 @dataclass
 class ScoredCar:
     car: Car
     score: float
 
 
+# Scores of one search under many weight vectors. Rows follow the weight
+# vectors and positions refer to car_ids. Without a top-K, ranks holds the
+# rank of every car (0 is best); with one, top_indices and top_scores hold the
+# K best cars per vector.
+@dataclass
+class BatchScores:
+    car_ids: list[str]
+    ranks: np.ndarray | None = None
+    top_indices: np.ndarray | None = None
+    top_scores: np.ndarray | None = None
+
+
+# A car priced below the depreciation curve for its age. The residual is the
+# price minus the expected price and the z-score is its robust z-score among
+# the cars the curve was fitted to.
+@dataclass
+class DealCar:
+    car: Car
+    expected_price: float
+    residual: float
+    z_score: float
+
+
+@dataclass
+class SimilarCar:
+    car: Car
+    distance: float
+
+
 @dataclass
 class GroupedCarsByManufacturerAndModel:
     manufacturer: str
@@ -53,6 +476,34 @@ class GroupedCarsByManufacturerAndModel:
     cars: list[Car]
 
 
+# Quantiles of price, mileage and age in days per group, one value per entry
+# of quantiles, e.g. p10, median and p90.
+@dataclass
+class GroupedQuantiles:
+    manufacturer: str
+    model: str
+    count: int
+    quantiles: list[float]
+    price_quantiles: list[float]
+    mileage_quantiles: list[float]
+    age_quantiles: list[float]
+
+
+# Market of one search name on one scrape date for one group. Trends follow
+# the latest scrape of a search name per day.
+@dataclass
+class MarketTrend:
+    search_name: str
+    scrape_date: datetime.date
+    manufacturer: str
+    model: str
+    count: int
+    mean_price: float
+    median_price: float
+    mean_mileage: float
+    median_mileage: float
+
+
 class RegressionFunctionType(Enum):
     LINEAR = ("Linear", regression_functions.linear_depreciation)
     EXPONENTIAL = (
@@ -84,3 +535,45 @@ class RegressionFunctionType(Enum):
         obj._value_ = value
         obj.function = function
         return obj
+
+
+@dataclass
+class RegressionModelFit:
+    function_type: RegressionFunctionType
+    params: list[float]
+    residual_sum_of_squares: float
+    root_mean_squared_error: float
+    r_squared: float
+    aic: float
+    bic: float
+    best: bool = False
+    error: str | None = None
+
+
+@dataclass
+class GroupedRegressionLine:
+    manufacturer: str
+    model: str
+    count: int
+    params: list[float]
+    dates: list[datetime.datetime]
+    prices: list[float]
+
+
+@dataclass
+class BinnedRegressionDeviation:
+    bin_days: int
+    bin_count: int
+    max_absolute_deviation: float
+    max_relative_deviation: float
+    root_mean_squared_error_binned: float
+    root_mean_squared_error_full: float
+
+
+@dataclass
+class RegressionParameters:
+    function_type: RegressionFunctionType
+    params: list[float]
+    reference_time: datetime.datetime
+    min_age: float
+    max_age: float
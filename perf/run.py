@@ -1,16 +1,17 @@
 import cProfile
 import datetime
-from pathlib import Path
 import pstats
 import random
 import uuid
+from pathlib import Path
+
+import numpy as np
 
-from drivematch._internal.analysis import CarsAnalyzer
+from drivematch._internal.analysis import CarsAnalyzer, pareto_front
 from drivematch._internal.db import SQLiteSearchesRepository
 from drivematch._internal.scraping import MobileDeScraper
 from drivematch.core import DriveMatchService
-from drivematch.types import Car
-from drivematch.types import RegressionFunctionType
+from drivematch.types import Car, RegressionFunctionType
 
 repository = SQLiteSearchesRepository(":memory:")
 
@@ -70,12 +71,35 @@ functions = [
         "perf/get_groups.prof",
         lambda: drivematch_service.get_groups(search_id),
     ],
+    [
+        "perf/get_pareto_front.prof",
+        lambda: drivematch_service.get_pareto_front(search_id),
+    ],
     [
         "perf/get_regression_line.prof",
         lambda: drivematch_service.get_regression_line(search_id, RegressionFunctionType.POLYNOMIAL_4),
     ]
 ]
 
+# The skyline should scale close to N log N: its time should only grow a bit
+# faster than N while N doubles.
+frame = repository.get_car_frame_for_search(search_id)
+objectives = np.column_stack(
+    (
+        -frame.horse_powers,
+        frame.prices,
+        frame.mileages,
+        -frame.first_registration_days,
+    )
+)
+functions += [
+    [
+        f"perf/pareto_front_{size}.prof",
+        lambda size=size: pareto_front(objectives[:size]),
+    ]
+    for size in [25000, 50000, 100000, 200000]
+]
+
 for function in functions:
     with cProfile.Profile() as profiler:
         function[1]()
@@ -1,9 +1,17 @@
+import dataclasses
 import datetime
+from collections.abc import Callable
 
+import numpy as np
 import pytest
 
-from drivematch._internal.analysis import CarsAnalyzer
-from drivematch.types import Car, RegressionFunctionType
+from drivematch._internal.analysis import (
+    CarsAnalyzer,
+    StreamingGroupStatistics,
+    pareto_front,
+    select_top,
+)
+from drivematch.types import Car, CarFrame, RegressionFunctionType, epoch_day
 
 
 @pytest.fixture
@@ -107,3 +115,442 @@ def test_should_handle_all_regression_functions(
     assert len(line[0]) > 1
     assert len(line[1]) > 1
     assert len(line[0]) == len(line[1])
+
+
+@pytest.mark.unit
+def test_should_score_cars_like_per_car_scoring(
+    random_cars: Callable[..., list[Car]],
+) -> None:
+    cars = random_cars(500)
+    analyzer = CarsAnalyzer(cars)
+    analyzer.set_weights_and_filters(
+        weight_hp=1.0,
+        weight_price=-1.0,
+        weight_mileage=-0.5,
+        weight_age=-1.0,
+        preferred_age=1000,
+        weight_advertisement_age=-0.5,
+        preferred_advertisement_age=5,
+        filter_by_manufacturers=[],
+        filter_by_models=[],
+    )
+
+    scored_cars = analyzer.get_scored_cars()
+    expected = sorted(
+        ((car, analyzer.score(car)) for car in cars),
+        key=lambda x: x[1],
+        reverse=True,
+    )
+
+    assert [scored_car.car for scored_car in scored_cars] == [x[0] for x in expected]
+    assert [scored_car.score for scored_car in scored_cars] == [x[1] for x in expected]
+
+
+@pytest.mark.unit
+def test_should_score_car_frame_like_list_of_cars(
+    random_cars: Callable[..., list[Car]],
+) -> None:
+    cars = random_cars(200)
+    frame = CarFrame.from_cars(cars)
+    assert frame.to_cars() == cars
+
+    list_analyzer = CarsAnalyzer(cars)
+    frame_analyzer = CarsAnalyzer(frame)
+    for analyzer in (list_analyzer, frame_analyzer):
+        analyzer.set_weights_and_filters(1.0, -1.0, -1.0, -1.0, 0, 0, 0, [], [])
+
+    assert frame_analyzer.get_scored_cars() == list_analyzer.get_scored_cars()
+    assert frame_analyzer.get_grouped_cars() == list_analyzer.get_grouped_cars()
+
+
+@pytest.mark.unit
+def test_should_select_top_scores_like_a_full_stable_sort() -> None:
+    rng = np.random.default_rng(7)
+    scores = rng.integers(0, 20, size=1000).astype(np.float64)
+    full_order = np.argsort(-scores, kind="stable")
+
+    for amount in (0, 1, 5, 50, 999, 1000, 2000):
+        assert select_top(scores, amount).tolist() == full_order[:amount].tolist()
+
+
+@pytest.mark.unit
+def test_should_page_through_scored_cars(random_cars: Callable[..., list[Car]]) -> None:
+    analyzer = CarsAnalyzer(random_cars(300))
+    analyzer.set_weights_and_filters(1.0, -1.0, -1.0, 0, 0, 0, 0, ["bmw"], [])
+
+    all_scored_cars = analyzer.get_scored_cars()
+    assert all(scored_car.car.manufacturer == "BMW" for scored_car in all_scored_cars)
+    assert analyzer.get_scored_cars(limit=10) == all_scored_cars[:10]
+    assert analyzer.get_scored_cars(limit=10, offset=20) == all_scored_cars[20:30]
+
+
+@pytest.mark.unit
+def test_should_filter_scored_cars_by_required_attributes(
+    random_cars: Callable[..., list[Car]],
+) -> None:
+    attribute_sets = [["Unfallfrei", "Navi"], ["Navi", "AHK, abnehmbar"], []]
+    cars = [
+        dataclasses.replace(car, attributes=attribute_sets[i % len(attribute_sets)])
+        for i, car in enumerate(random_cars(200))
+    ]
+    analyzer = CarsAnalyzer(cars)
+
+    required = ["navi", "AHK, abnehmbar"]
+    mask = analyzer.frame.attribute_mask(required)
+    assert mask.tolist() == [
+        {"Navi", "AHK, abnehmbar"} <= set(car.attributes) for car in cars
+    ]
+    analyzer.set_weights_and_filters(
+        1.0, -1.0, -1.0, 0, 0, 0, 0, [], [], filter_by_attributes=required
+    )
+    scored_ids = {scored_car.car.id for scored_car in analyzer.get_scored_cars()}
+    assert scored_ids == {car.id for car, kept in zip(cars, mask, strict=True) if kept}
+    assert not analyzer.frame.attribute_mask(["Leder"]).any()
+
+
+@pytest.mark.unit
+def test_should_normalize_filtered_cars_over_all_or_filtered_cars(
+    random_cars: Callable[..., list[Car]],
+) -> None:
+    cars = random_cars(300)
+    analyzer = CarsAnalyzer(cars)
+    analyzer.set_weights_and_filters(1.0, -1.0, -1.0, -1.0, 0, 0, 0, [], [])
+    unfiltered_scores = {
+        scored_car.car.id: scored_car.score for scored_car in analyzer.get_scored_cars()
+    }
+
+    analyzer.set_weights_and_filters(1.0, -1.0, -1.0, -1.0, 0, 0, 0, ["Audi"], ["a6"])
+    filtered = analyzer.get_scored_cars()
+    assert all(
+        (scored_car.car.manufacturer, scored_car.car.model) == ("Audi", "A6")
+        for scored_car in filtered
+    )
+    assert [scored_car.score for scored_car in filtered] == [
+        unfiltered_scores[scored_car.car.id] for scored_car in filtered
+    ]
+
+    subset_analyzer = CarsAnalyzer(
+        [car for car in cars if (car.manufacturer, car.model) == ("Audi", "A6")]
+    )
+    subset_analyzer.set_weights_and_filters(1.0, -1.0, -1.0, -1.0, 0, 0, 0, [], [])
+    analyzer.set_weights_and_filters(
+        1.0, -1.0, -1.0, -1.0, 0, 0, 0, ["Audi"], ["a6"], normalize_over_filtered=True
+    )
+    assert analyzer.get_scored_cars() == subset_analyzer.get_scored_cars()
+
+
+@pytest.mark.unit
+def test_should_aggregate_groups_like_per_car_sums(
+    random_cars: Callable[..., list[Car]],
+) -> None:
+    cars = random_cars(500)
+    analyzer = CarsAnalyzer(cars)
+
+    grouped_cars = analyzer.get_grouped_cars()
+    expected: dict[tuple[str, str], list[Car]] = {}
+    for car in cars:
+        expected.setdefault((car.manufacturer, car.model), []).append(car)
+
+    assert [(g.manufacturer, g.model) for g in grouped_cars] == sorted(
+        expected, key=lambda key: len(expected[key]), reverse=True
+    )
+    for group in grouped_cars:
+        members = expected[(group.manufacturer, group.model)]
+        assert group.cars == members
+        assert group.count == len(members)
+        assert group.average_price == sum(car.price for car in members) / len(members)
+        assert group.average_mileage == sum(car.mileage for car in members) / len(
+            members
+        )
+
+    without_cars = analyzer.get_grouped_cars(include_cars=False)
+    assert all(group.cars == [] for group in without_cars)
+    assert [group.average_price for group in without_cars] == [
+        group.average_price for group in grouped_cars
+    ]
+
+
+@pytest.mark.unit
+def test_should_fit_a_regression_line_per_large_enough_group(
+    random_cars: Callable[..., list[Car]],
+) -> None:
+    cars = random_cars(300) + random_cars(3, seed=1)
+    cars[-3:] = [
+        dataclasses.replace(car, manufacturer="Opel", model="Corsa")
+        for car in cars[-3:]
+    ]
+    analyzer = CarsAnalyzer(cars)
+
+    lines = analyzer.get_grouped_regression_lines(
+        RegressionFunctionType.LINEAR, min_group_size=10
+    )
+
+    groups = analyzer.get_grouped_cars(include_cars=False)
+    assert [(line.manufacturer, line.model, line.count) for line in lines] == [
+        (group.manufacturer, group.model, group.count)
+        for group in groups
+        if group.count >= 10
+    ]
+    assert all(len(line.dates) == len(line.prices) == 500 for line in lines)
+
+
+@pytest.mark.unit
+def test_should_report_deviation_of_binned_regression(
+    random_cars: Callable[..., list[Car]],
+) -> None:
+    analyzer = CarsAnalyzer(random_cars(2000))
+
+    deviation = analyzer.compare_binned_regression(
+        RegressionFunctionType.POLYNOMIAL_2, bin_days=30
+    )
+
+    assert deviation.bin_count < 2000
+    assert deviation.max_relative_deviation < 0.01
+    assert deviation.root_mean_squared_error_binned == pytest.approx(
+        deviation.root_mean_squared_error_full, rel=1e-3
+    )
+    dates, prices = analyzer.get_regression_line(
+        RegressionFunctionType.POLYNOMIAL_2, bin_days=30
+    )
+    assert len(dates) == len(prices) == 500
+
+
+@pytest.mark.unit
+def test_should_not_compare_binned_regression_without_cars() -> None:
+    analyzer = CarsAnalyzer()
+
+    with pytest.raises(ValueError, match="at least two cars"):
+        analyzer.compare_binned_regression(RegressionFunctionType.LINEAR, bin_days=30)
+
+
+@pytest.mark.unit
+def test_should_reuse_feature_matrix_until_preferred_ages_change(
+    random_cars: Callable[..., list[Car]],
+) -> None:
+    analyzer = CarsAnalyzer(random_cars(300))
+    analyzer.set_weights_and_filters(1.0, -1.0, -1.0, -1.0, 0, 0, 0, [], [])
+    analyzer.get_scored_cars()
+    feature_matrix = analyzer.feature_matrix
+
+    analyzer.set_weights_and_filters(2.0, -0.5, -1.0, 0.5, 0, -1.0, 0, ["BMW"], [])
+    reweighted = analyzer.get_scored_cars(limit=20)
+    assert analyzer.feature_matrix is feature_matrix
+    fresh_analyzer = CarsAnalyzer(analyzer.cars)
+    fresh_analyzer.set_weights_and_filters(
+        2.0, -0.5, -1.0, 0.5, 0, -1.0, 0, ["BMW"], []
+    )
+    assert reweighted == fresh_analyzer.get_scored_cars()[:20]
+
+    analyzer.set_weights_and_filters(2.0, -0.5, -1.0, 0.5, 365, -1.0, 0, [], [])
+    analyzer.get_scored_cars()
+    assert analyzer.feature_matrix is not feature_matrix
+
+
+@pytest.mark.unit
+def test_should_score_many_weight_vectors_like_single_scoring(
+    random_cars: Callable[..., list[Car]],
+) -> None:
+    analyzer = CarsAnalyzer(random_cars(400))
+    weight_matrix = np.random.default_rng(11).uniform(-1, 1, size=(6, 5))
+    analyzer.set_weights_and_filters(0, 0, 0, 0, 500, 0, 3, ["Audi", "VW"], [])
+
+    ranked = analyzer.get_batch_scores(weight_matrix, max_chunk_size=1000)
+    top = analyzer.get_batch_scores(weight_matrix, top_k=15, max_chunk_size=1000)
+
+    for row, weights in enumerate(weight_matrix):
+        analyzer.set_weights_and_filters(
+            *weights[:4], 500, weights[4], 3, ["Audi", "VW"], []
+        )
+        expected = [scored_car.car.id for scored_car in analyzer.get_scored_cars()]
+        assert [ranked.car_ids[i] for i in np.argsort(ranked.ranks[row])] == expected
+        assert [top.car_ids[i] for i in top.top_indices[row]] == expected[:15]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("block_size", [7, 1024])
+def test_should_find_pareto_front_like_pairwise_dominance(block_size: int) -> None:
+    objectives = np.random.default_rng(13).integers(0, 12, size=(600, 4))
+    objectives[:5] = objectives[5]
+
+    expected = [
+        index
+        for index, point in enumerate(objectives)
+        if not any(
+            np.all(other <= point) and np.any(other < point) for other in objectives
+        )
+    ]
+
+    assert pareto_front(objectives, block_size).tolist() == expected
+
+
+@pytest.mark.unit
+def test_should_return_pareto_optimal_cars(
+    random_cars: Callable[..., list[Car]],
+) -> None:
+    cars = random_cars(500)
+    analyzer = CarsAnalyzer(cars)
+
+    front = analyzer.get_pareto_front(filter_by_manufacturers=["BMW"])
+
+    assert front
+    assert [car.price for car in front] == sorted(car.price for car in front)
+    for car in front:
+        assert car.manufacturer == "BMW"
+        assert not any(
+            other.manufacturer == "BMW"
+            and other.horse_power >= car.horse_power
+            and other.price <= car.price
+            and other.mileage <= car.mileage
+            and other.first_registration >= car.first_registration
+            and (
+                other.horse_power,
+                other.price,
+                other.mileage,
+                other.first_registration,
+            )
+            != (car.horse_power, car.price, car.mileage, car.first_registration)
+            for other in cars
+        )
+
+
+def depreciating_cars(cars: list[Car], deals: int) -> list[Car]:
+    # Prices follow an exponential depreciation curve with some noise, except
+    # for the first `deals` cars, which are offered at half of it.
+    rng = np.random.default_rng(5)
+    now = datetime.datetime.now()
+    depreciated_cars = []
+    for index, car in enumerate(cars):
+        age = (now - car.first_registration).days / 365.25
+        price = 60000 * np.exp(-0.12 * age) * (0.5 if index < deals else 1.0)
+        depreciated_cars.append(
+            dataclasses.replace(car, price=int(price + rng.normal(0, 1000)))
+        )
+    return depreciated_cars
+
+
+@pytest.mark.unit
+def test_should_find_cars_priced_below_the_depreciation_curve(
+    random_cars: Callable[..., list[Car]],
+) -> None:
+    analyzer = CarsAnalyzer(depreciating_cars(random_cars(400), deals=5))
+
+    threshold = 3.0
+    deals = analyzer.get_deals(RegressionFunctionType.EXPONENTIAL, threshold)
+
+    assert {deal.car.id for deal in deals} == {f"random_car_{i}" for i in range(5)}
+    assert [deal.z_score for deal in deals] == sorted(deal.z_score for deal in deals)
+    for deal in deals:
+        assert deal.residual == pytest.approx(deal.car.price - deal.expected_price)
+        assert deal.z_score <= -threshold
+
+
+@pytest.mark.unit
+def test_should_score_deals_next_to_the_other_weights(
+    random_cars: Callable[..., list[Car]],
+) -> None:
+    analyzer = CarsAnalyzer(depreciating_cars(random_cars(400), deals=5))
+    analyzer.set_weights_and_filters(0, 0, 0, 0, 0, 0, 0, [], [], weight_deal=1.0)
+
+    best = [scored_car.car.id for scored_car in analyzer.get_scored_cars(limit=5)]
+    assert set(best) == {f"random_car_{i}" for i in range(5)}
+
+    weight_matrix = np.array([[1.0, -1.0, -1.0, -1.0, 0.0, 0.5]])
+    top = analyzer.get_batch_scores(weight_matrix, top_k=10)
+    analyzer.set_weights_and_filters(
+        1.0, -1.0, -1.0, -1.0, 0, 0.0, 0, [], [], weight_deal=0.5
+    )
+    expected = [scored_car.car.id for scored_car in analyzer.get_scored_cars(10)]
+    assert [top.car_ids[i] for i in top.top_indices[0]] == expected
+
+
+@pytest.mark.unit
+def test_should_count_ages_in_whole_days_up_to_the_as_of_day(
+    car1: Car, car2: Car
+) -> None:
+    car2 = dataclasses.replace(
+        car2, advertised_since=datetime.datetime(2023, 12, 30, 23, 59)
+    )
+    car1 = dataclasses.replace(car1, advertised_since=datetime.datetime(2023, 12, 31))
+    analyzer = CarsAnalyzer([car1, car2])
+    analyzer.set_as_of(datetime.date(2024, 1, 1))
+
+    [group] = analyzer.get_grouped_cars(include_cars=False)
+
+    assert analyzer.frame.first_registration_days.tolist() == [18262, 18262]
+    assert group.average_age == 4 * 365 + 1
+    assert group.average_advertisement_age == (1 + 2) / 2
+    parameters = analyzer.fit_regression_parameters(RegressionFunctionType.LINEAR)
+    assert parameters.reference_time == datetime.datetime(2024, 1, 1)
+
+
+@pytest.mark.unit
+def test_should_merge_group_statistics_over_batches(
+    random_cars: Callable[..., list[Car]],
+) -> None:
+    cars = random_cars(500)
+    analyzer = CarsAnalyzer(cars)
+    analyzer.set_as_of(datetime.date(2025, 1, 1))
+    batches = [
+        CarFrame.from_cars(cars[start : start + 37]) for start in range(0, 500, 37)
+    ]
+
+    statistics = StreamingGroupStatistics(epoch_day(datetime.date(2025, 1, 1)))
+    for batch in batches:
+        statistics.add(batch)
+    streamed = analyzer.get_streamed_grouped_cars(batches)
+
+    expected = analyzer.get_grouped_cars(include_cars=False)
+    assert [(group.manufacturer, group.model, group.count) for group in streamed] == [
+        (group.manufacturer, group.model, group.count) for group in expected
+    ]
+    for group, expected_group in zip(streamed, expected, strict=True):
+        assert group.average_price == pytest.approx(expected_group.average_price)
+        assert group.average_mileage == pytest.approx(expected_group.average_mileage)
+        assert group.average_age == pytest.approx(expected_group.average_age)
+        assert group.average_advertisement_age == pytest.approx(
+            expected_group.average_advertisement_age
+        )
+
+    variances = statistics.variances()
+    for (manufacturer, model), group in statistics.group_ids.items():
+        prices = [
+            car.price
+            for car in cars
+            if (car.manufacturer, car.model) == (manufacturer, model)
+        ]
+        assert variances[0, group] == pytest.approx(np.var(prices))
+
+
+@pytest.mark.unit
+def test_should_find_similar_cars_like_a_linear_scan(
+    random_cars: Callable[..., list[Car]],
+) -> None:
+    cars = random_cars(600)
+    analyzer = CarsAnalyzer(cars)
+    analyzer.set_as_of(datetime.date(2025, 1, 1))
+    query_ids = ["random_car_0", "random_car_1", "random_car_2"]
+
+    similar_cars = analyzer.get_similar_cars(query_ids, k=5)
+    index = analyzer.similarity_index
+    assert analyzer.get_similar_cars(query_ids[:1], k=5) == similar_cars[:1]
+    assert analyzer.similarity_index is index
+
+    features = index.features
+    for query_id, neighbours in zip(query_ids, similar_cars, strict=True):
+        row = int(query_id.removeprefix("random_car_"))
+        same_group = [
+            other
+            for other, car in enumerate(cars)
+            if other != row
+            and (car.manufacturer, car.model)
+            == (cars[row].manufacturer, cars[row].model)
+        ]
+        distances = np.linalg.norm(features[same_group] - features[row], axis=1)
+        expected = np.array(same_group)[np.argsort(distances, kind="stable")[:5]]
+        assert [neighbour.car.id for neighbour in neighbours] == [
+            cars[other].id for other in expected
+        ]
+        np.testing.assert_allclose(
+            [neighbour.distance for neighbour in neighbours],
+            np.sort(distances)[:5],
+        )
@@ -0,0 +1,52 @@
+import datetime
+import random
+from collections.abc import Callable
+
+import pytest
+
+from drivematch.types import Car
+
+
+def _random_cars(amount: int, seed: int = 42) -> list[Car]:
+    rng = random.Random(seed)
+    now = datetime.datetime.now()
+    return [
+        Car(
+            id=f"random_car_{i}",
+            timestamp=now,
+            manufacturer=rng.choice(["BMW", "Audi", "VW"]),
+            model=rng.choice(["M3", "A6", "Golf"]),
+            description="random test car",
+            price=rng.randint(15000, 80000),
+            mileage=rng.randint(10000, 150000),
+            horse_power=rng.randint(100, 500),
+            fuel_type=rng.choice(["Petrol", "Diesel"]),
+            first_registration=datetime.datetime(
+                rng.randint(2010, 2024), rng.randint(1, 12), rng.randint(1, 28)
+            ),
+            advertised_since=now - datetime.timedelta(days=rng.randint(1, 30)),
+            private_seller=rng.choice([True, False]),
+            details_url=f"https://example.com/car{i}",
+            image_url=f"https://example.com/car{i}.jpg",
+            attributes=["a"],
+        )
+        for i in range(amount)
+    ]
+
+
+@pytest.fixture
+def random_cars() -> Callable[..., list[Car]]:
+    # Creates `amount` cars with reproducible random values for a seed.
+    return _random_cars
+
+
+@pytest.fixture
+def forbid(monkeypatch: pytest.MonkeyPatch) -> Callable[[object, str, str], None]:
+    # Replaces a method with one that fails the test with the given reason.
+    def forbid(target: object, name: str, reason: str) -> None:
+        def fail(*_: object) -> None:
+            pytest.fail(reason)
+
+        monkeypatch.setattr(target, name, fail)
+
+    return forbid
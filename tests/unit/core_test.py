@@ -0,0 +1,182 @@
+import dataclasses
+import datetime
+from collections.abc import Callable
+
+import numpy as np
+import pytest
+
+from drivematch._internal.analysis import CarsAnalyzer
+from drivematch._internal.db import SQLiteSearchesRepository
+from drivematch._internal.scraping import MobileDeScraper
+from drivematch.core import DriveMatchService
+from drivematch.types import Car, RegressionFunctionType
+
+
+@pytest.fixture
+def service(random_cars: Callable[..., list[Car]]) -> DriveMatchService:
+    repository = SQLiteSearchesRepository(":memory:")
+    repository.insert_cars_for_search(
+        "search1", "Example", "https://example.com", random_cars(200)
+    )
+    return DriveMatchService(repository, MobileDeScraper(), CarsAnalyzer())
+
+
+@pytest.mark.unit
+def test_should_reuse_cached_regression_parameters(
+    service: DriveMatchService, forbid: Callable[[object, str, str], None]
+) -> None:
+    first_line = service.get_regression_line(
+        "search1", RegressionFunctionType.POLYNOMIAL_2
+    )
+
+    forbid(
+        service.searches_repository,
+        "get_car_frame_for_search",
+        "the cars should not be loaded again",
+    )
+    second_line = service.get_regression_line(
+        "search1", RegressionFunctionType.POLYNOMIAL_2
+    )
+
+    assert second_line[0].tolist() == first_line[0].tolist()
+    assert second_line[1].tolist() == first_line[1].tolist()
+
+
+@pytest.mark.unit
+def test_should_not_reload_search_for_weight_changes(
+    service: DriveMatchService, forbid: Callable[[object, str, str], None]
+) -> None:
+    first_scores = service.get_scores(
+        "search1", 1.0, -1.0, -1.0, -1.0, 0, 0, 0, [], [], limit=10
+    )
+
+    forbid(
+        service.searches_repository,
+        "get_car_frame_for_search",
+        "the cars should not be loaded again",
+    )
+    second_scores = service.get_scores(
+        "search1", -1.0, 1.0, -1.0, -1.0, 0, 0, 0, [], [], limit=10
+    )
+
+    assert len(second_scores) == len(first_scores) == 10
+    assert second_scores != first_scores
+
+
+@pytest.mark.unit
+def test_should_reload_search_after_its_cars_changed_elsewhere(
+    service: DriveMatchService, random_cars: Callable[..., list[Car]]
+) -> None:
+    first_scores = service.get_scores("search1", 1.0, -1.0, -1.0, -1.0, 0, 0, 0, [], [])
+    # A re-listing scraped on the same day, e.g. by another process, also
+    # belongs to the loaded search.
+    relisted_car = dataclasses.replace(
+        random_cars(1)[0], timestamp=datetime.datetime.now()
+    )
+    service.searches_repository.insert_cars_for_search(
+        "search2", "Other", "https://example.com", [relisted_car]
+    )
+
+    second_scores = service.get_scores(
+        "search1", 1.0, -1.0, -1.0, -1.0, 0, 0, 0, [], []
+    )
+
+    assert len(second_scores) == len(first_scores) + 1
+
+
+@pytest.mark.unit
+def test_should_stream_groups_without_loading_the_search(
+    service: DriveMatchService, forbid: Callable[[object, str, str], None]
+) -> None:
+    expected = service.get_groups("search1", include_cars=False)
+    service.loaded_search_id = None
+
+    forbid(
+        service.searches_repository,
+        "get_car_frame_for_search",
+        "the cars should be streamed instead of loaded",
+    )
+    streamed = service.get_groups("search1", streaming=True)
+
+    assert [(group.manufacturer, group.model, group.count) for group in streamed] == [
+        (group.manufacturer, group.model, group.count) for group in expected
+    ]
+    for group, expected_group in zip(streamed, expected, strict=True):
+        assert group.average_price == pytest.approx(expected_group.average_price)
+        assert group.average_age == pytest.approx(expected_group.average_age)
+        assert group.cars == []
+
+
+@pytest.mark.unit
+def test_should_merge_persisted_quantile_sketches_across_searches(
+    service: DriveMatchService, forbid: Callable[[object, str, str], None]
+) -> None:
+    service.searches_repository.insert_cars_for_search(
+        "search2", "Other", "https://example.com", []
+    )
+    cars = service.searches_repository.get_cars_for_search("search1")
+    service.get_group_quantiles(["search1", "search2"])
+
+    forbid(
+        service.searches_repository,
+        "get_car_frame_for_search",
+        "the persisted sketches should be merged instead",
+    )
+    groups = service.get_group_quantiles(["search1", "search2"], [0.5])
+
+    assert sum(group.count for group in groups) == len(cars)
+    for group in groups:
+        prices = [
+            car.price
+            for car in cars
+            if (car.manufacturer, car.model) == (group.manufacturer, group.model)
+        ]
+        assert group.price_quantiles == [
+            np.percentile(prices, 50, method="inverted_cdf")
+        ]
+
+
+@pytest.mark.unit
+def test_should_find_similar_cars_across_searches(
+    service: DriveMatchService, random_cars: Callable[..., list[Car]]
+) -> None:
+    other_cars = [
+        dataclasses.replace(car, id=f"other_{car.id}") for car in random_cars(5)
+    ]
+    service.searches_repository.insert_cars_for_search(
+        "search2", "Other", "https://example.com", other_cars
+    )
+
+    [in_search] = service.get_similar_cars("search1", ["random_car_0"], k=3)
+    [across_searches] = service.get_similar_cars(None, ["random_car_0"], k=3)
+
+    assert all(not similar.car.id.startswith("other_") for similar in in_search)
+    assert across_searches[0].car.id == "other_random_car_0"
+    assert across_searches[0].distance == 0
+
+
+@pytest.mark.unit
+def test_should_keep_latest_listing_of_cars_across_searches(
+    service: DriveMatchService,
+    forbid: Callable[[object, str, str], None],
+    random_cars: Callable[..., list[Car]],
+) -> None:
+    relisted_car = dataclasses.replace(
+        random_cars(1)[0], timestamp=datetime.datetime.now(), price=1
+    )
+    service.searches_repository.insert_cars_for_search(
+        "search2", "Other", "https://example.com", [relisted_car]
+    )
+
+    forbid(
+        service.searches_repository,
+        "get_cars_for_search",
+        "the cars should be read as frames",
+    )
+    k = 3
+    [similar_cars] = service.get_similar_cars(None, ["random_car_1"], k=k)
+    frame = service.all_searches_analyzer.frame
+
+    assert len(similar_cars) == k
+    assert sorted(frame.ids) == sorted(f"random_car_{i}" for i in range(200))
+    assert frame.car(frame.ids.index(relisted_car.id)) == relisted_car
@@ -1,9 +1,20 @@
+import dataclasses
 import datetime
+import pathlib
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 import pytest
 
-from drivematch._internal.db import SQLiteSearchesRepository
-from drivematch.types import Car
+from drivematch._internal.db import (
+    CARS_FOR_SEARCH,
+    PRICE_HISTORIES,
+    READ_CONNECTIONS,
+    SCHEMA_VERSION,
+    SQLiteSearchesRepository,
+)
+from drivematch.types import Car, RegressionFunctionType, RegressionParameters
 
 
 @pytest.mark.unit
@@ -40,9 +51,439 @@ def test_should_analyze_cars_data() -> None:
     retrieved_cars = repository.get_cars_for_search(search_id)
     assert retrieved_cars == cars
 
+    frame = repository.get_car_frame_for_search(search_id)
+    assert len(frame) == len(cars)
+    assert frame.manufacturers == ["Toyota"]
+    assert frame.to_cars() == cars
+
     searches = repository.get_searches()
     assert len(searches) == 1
     assert searches[0].id == search_id
     assert searches[0].name == name
     assert searches[0].url == url
     assert searches[0].amount_of_cars == len(cars)
+
+
+def example_car(car_id: str, timestamp: datetime.datetime) -> Car:
+    return Car(
+        id=car_id,
+        timestamp=timestamp,
+        manufacturer="Toyota",
+        model="Corolla",
+        description="A reliable car",
+        price=20000,
+        attributes=["automatic", "sedan"],
+        first_registration=datetime.datetime(2018, 5, 1),
+        mileage=15000,
+        horse_power=150,
+        fuel_type="Petrol",
+        advertised_since=timestamp,
+        private_seller=False,
+        details_url=f"http://example.com/{car_id}",
+        image_url=f"http://example.com/{car_id}.jpg",
+    )
+
+
+@pytest.mark.unit
+def test_should_cache_regression_parameters_until_cars_change() -> None:
+    repository = SQLiteSearchesRepository(":memory:")
+    now = datetime.datetime.now().replace(microsecond=0)
+    repository.insert_cars_for_search(
+        "search1", "Example", "http://example.com", [example_car("car1", now)]
+    )
+    fingerprint = repository.get_fingerprint_for_search("search1")
+    parameters = RegressionParameters(
+        function_type=RegressionFunctionType.LINEAR,
+        params=[20000.0, 1000.0],
+        reference_time=now,
+        min_age=1.0,
+        max_age=7.0,
+    )
+
+    repository.save_regression_parameters("search1", "{}", fingerprint, parameters)
+
+    assert (
+        repository.get_regression_parameters(
+            "search1", RegressionFunctionType.LINEAR, "{}", fingerprint
+        )
+        == parameters
+    )
+    assert (
+        repository.get_regression_parameters(
+            "search1", RegressionFunctionType.LINEAR, "{}", "other fingerprint"
+        )
+        is None
+    )
+
+    # A later scrape on the same day re-lists car1, which changes search1.
+    repository.insert_cars_for_search(
+        "search2",
+        "Example",
+        "http://example.com",
+        [example_car("car1", now + datetime.timedelta(seconds=1))],
+    )
+    new_fingerprint = repository.get_fingerprint_for_search("search1")
+    assert new_fingerprint != fingerprint
+    assert (
+        repository.get_regression_parameters(
+            "search1", RegressionFunctionType.LINEAR, "{}", new_fingerprint
+        )
+        is None
+    )
+
+
+@pytest.mark.unit
+def test_should_read_price_histories_in_one_indexed_query() -> None:
+    repository = SQLiteSearchesRepository(":memory:")
+    start = datetime.datetime(2024, 3, 1, 12)
+    for day, prices in enumerate([(21000, 9000), (20000,), (18500, 8800)]):
+        scraped_at = start + datetime.timedelta(days=10 * day)
+        cars = [
+            dataclasses.replace(
+                example_car(car_id, scraped_at),
+                price=price,
+                mileage=15000 + 100 * day,
+                advertised_since=start,
+            )
+            for car_id, price in zip(["car1", "car2"], prices, strict=False)
+        ]
+        repository.insert_cars_for_search(f"search{day}", "Example", "", cars)
+
+    histories = repository.get_price_histories()
+
+    assert histories.car_ids == ["car1", "car2"]
+    assert histories.offsets.tolist() == [0, 3, 5]
+    assert histories.prices.tolist() == [21000, 20000, 18500, 9000, 8800]
+    assert histories.mileages[:3].tolist() == [15000, 15100, 15200]
+    assert histories.timestamps[3] == np.datetime64(start)
+    assert histories.days_on_market.tolist() == [20, 20]
+    only_car2 = repository.get_price_histories(["car2", "unknown"])
+    assert only_car2.car_ids == ["car2"]
+    assert only_car2.prices.tolist() == [9000, 8800]
+
+    plan = repository.cursor.execute(
+        "EXPLAIN QUERY PLAN " + PRICE_HISTORIES.format(where="")
+    ).fetchall()
+    assert any("USING INDEX sqlite_autoindex_cars_1" in row[3] for row in plan)
+    assert not any("TEMP B-TREE" in row[3] for row in plan)
+
+
+@pytest.mark.unit
+def test_should_keep_market_trends_of_the_latest_scrape_per_day(
+    tmp_path: pathlib.Path,
+) -> None:
+    db_path = str(tmp_path / "drivematch.db")
+    repository = SQLiteSearchesRepository(db_path)
+    now = datetime.datetime.now().replace(microsecond=0)
+    first_scrape = [
+        dataclasses.replace(example_car(f"car{i}", now), price=10000 * (i + 1))
+        for i in range(3)
+    ]
+    repository.insert_cars_for_search("search1", "Example", "", first_scrape)
+    repository.insert_cars_for_search("other", "Other", "", [example_car("car9", now)])
+    later_scrape = [
+        dataclasses.replace(car, timestamp=now + datetime.timedelta(seconds=1))
+        for car in first_scrape[:2]
+    ]
+    repository.insert_cars_for_search("search2", "Example", "", later_scrape)
+
+    [trend] = repository.get_market_trends("Example", ["toyota"])
+    assert trend.scrape_date == now.date()
+    assert (trend.manufacturer, trend.model, trend.count) == ("Toyota", "Corolla", 2)
+    assert trend.mean_price == trend.median_price == (10000 + 20000) / 2
+    assert trend.mean_mileage == trend.median_mileage == first_scrape[0].mileage
+    assert repository.get_market_trends("Example", models=["Golf"]) == []
+
+    # Databases created before the trend table get it filled on startup.
+    repository.cursor.execute("DROP TABLE market_trends")
+    repository.connection.commit()
+    assert SQLiteSearchesRepository(db_path).get_market_trends("Example") == [trend]
+
+
+@pytest.mark.unit
+def test_should_list_searches_with_their_stored_car_counts(
+    tmp_path: pathlib.Path,
+) -> None:
+    db_path = str(tmp_path / "drivematch.db")
+    repository = SQLiteSearchesRepository(db_path)
+    now = datetime.datetime.now().replace(microsecond=0)
+    first_scrape = [example_car(f"car{i}", now) for i in range(3)]
+    repository.insert_cars_for_search("search1", "Example", "", first_scrape)
+    later_scrape = [
+        dataclasses.replace(car, timestamp=now + datetime.timedelta(seconds=1))
+        for car in first_scrape[:2]
+    ]
+    repository.insert_cars_for_search("search2", "Example", "", later_scrape)
+    repository.insert_cars_for_search("empty", "Empty", "", [])
+    counts = {search.id: search.amount_of_cars for search in repository.get_searches()}
+    # Both searches also list the cars re-listed on the same day.
+    assert counts == {
+        "search1": len(first_scrape) + len(later_scrape),
+        "search2": len(later_scrape) * 2,
+        "empty": 0,
+    }
+    assert counts == {
+        search_id: len(repository.get_cars_for_search(search_id))
+        for search_id in counts
+    }
+
+    # Databases created before the counter column get it filled on startup.
+    repository.cursor.execute("ALTER TABLE searches DROP COLUMN amountOfCars")
+    repository.connection.commit()
+    searches = SQLiteSearchesRepository(db_path).get_searches()
+    assert {search.id: search.amount_of_cars for search in searches} == counts
+
+
+@pytest.mark.unit
+def test_should_join_cars_of_a_search_through_indexes() -> None:
+    repository = SQLiteSearchesRepository(":memory:")
+    now = datetime.datetime.now().replace(microsecond=0)
+    cars = [example_car(f"car{i}", now) for i in (3, 1, 2)]
+    repository.insert_cars_for_search("search", "Example", "", cars)
+
+    # Cars come back in the order of the scrape, not in car ID order.
+    assert repository.get_cars_for_search("search") == cars
+    plan = [
+        row[3]
+        for row in repository.cursor.execute(
+            "EXPLAIN QUERY PLAN SELECT cars.* " + CARS_FOR_SEARCH, ("search",)
+        )
+    ]
+    assert plan[1].startswith(
+        "SEARCH searches_cars USING INDEX searches_cars_by_search"
+    )
+    assert plan[2].startswith("SEARCH cars USING INDEX cars_by_scrape_date")
+    assert not any(step.startswith("SCAN") for step in plan)
+
+    fingerprint_plan = repository.cursor.execute(
+        "EXPLAIN QUERY PLAN SELECT COUNT(*), TOTAL(cars.price), "
+        "MAX(cars.timestamp) " + CARS_FOR_SEARCH,
+        ("search",),
+    ).fetchall()
+    assert "COVERING INDEX cars_by_scrape_date" in fingerprint_plan[-1][3]
+
+
+@pytest.mark.unit
+def test_should_migrate_databases_of_older_schema_versions(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    db_path = str(tmp_path / "drivematch.db")
+    now = datetime.datetime.now().replace(microsecond=0)
+    car = dataclasses.replace(
+        example_car("car1", now.replace(microsecond=123456)),
+        first_registration=datetime.datetime.fromordinal(
+            datetime.date(1965, 3, 1).toordinal()
+        ),
+        advertised_since=now - datetime.timedelta(days=3),
+    )
+    connection = sqlite3.connect(db_path)
+    connection.execute(
+        "CREATE TABLE searches (id TEXT PRIMARY KEY, name TEXT, url TEXT, timestamp DATETIME)"
+    )
+    connection.execute("CREATE TABLE searches_cars (search_id TEXT, car_id TEXT)")
+    connection.execute(
+        "CREATE TABLE cars (id TEXT, timestamp DATETIME, manufacturer TEXT, model TEXT, description TEXT, price INTEGER, attributes TEXT, firstRegistration DATETIME, mileage INTEGER, horsePower INTEGER, fuelType TEXT, advertisedSince DATETIME, privateSeller INTEGER, detailsURL TEXT, imageURL TEXT, PRIMARY KEY (id, timestamp))"
+    )
+    connection.execute(
+        "INSERT INTO searches VALUES (?, ?, ?, ?)",
+        ("search1", "Example", "", now.isoformat()),
+    )
+    connection.execute("INSERT INTO searches_cars VALUES (?, ?)", ("search1", "car1"))
+    connection.execute(
+        "INSERT INTO cars VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            car.id,
+            car.timestamp.isoformat(),
+            car.manufacturer,
+            car.model,
+            car.description,
+            car.price,
+            ",".join(car.attributes),
+            car.first_registration.isoformat(),
+            car.mileage,
+            car.horse_power,
+            car.fuel_type,
+            car.advertised_since.isoformat(),
+            car.private_seller,
+            car.details_url,
+            car.image_url,
+        ),
+    )
+    connection.commit()
+    connection.close()
+
+    # An interrupted upgrade leaves the database as it was.
+    def interrupt(_: SQLiteSearchesRepository) -> None:
+        msg = "interrupted"
+        raise sqlite3.OperationalError(msg)
+
+    monkeypatch.setattr(
+        SQLiteSearchesRepository, "_index_links_in_insertion_order", interrupt
+    )
+    with pytest.raises(sqlite3.OperationalError, match="interrupted"):
+        SQLiteSearchesRepository(db_path)
+    monkeypatch.undo()
+
+    repository = SQLiteSearchesRepository(db_path)
+
+    assert repository.cursor.execute("PRAGMA user_version").fetchone() == (
+        SCHEMA_VERSION,
+    )
+    assert repository.get_cars_for_search("search1") == [car]
+    [search] = repository.get_searches()
+    assert search.amount_of_cars == 1
+    [trend] = repository.get_market_trends("Example")
+    assert trend.count == 1
+    assert repository.get_price_histories().days_on_market.tolist() == [3]
+    assert (
+        repository.cursor.execute(
+            "SELECT typeof(timestamp), typeof(firstRegistration), "
+            "typeof(advertisedSince), typeof(scrapeDate) FROM cars"
+        ).fetchone()
+        == ("integer",) * 4
+    )
+    assert not repository.cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'cars_attributes'"
+    ).fetchone()
+
+
+@pytest.mark.unit
+def test_should_read_in_parallel_while_another_connection_writes(
+    tmp_path: pathlib.Path,
+) -> None:
+    db_path = str(tmp_path / "drivematch.db")
+    repository = SQLiteSearchesRepository(db_path, concurrent=True)
+    now = datetime.datetime.now().replace(microsecond=0)
+    cars = [example_car(f"car{i}", now) for i in range(3)]
+    repository.insert_cars_for_search("search1", "Example", "", cars)
+
+    # An open write transaction must not hold back readers in WAL mode.
+    writer = sqlite3.connect(db_path, timeout=0)
+    writer.execute("BEGIN IMMEDIATE")
+    writer.execute("DELETE FROM searches_cars")
+    # More threads than read connections take turns with them.
+    workers = READ_CONNECTIONS * 2
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(repository.get_cars_for_search, ["search1"] * 16))
+    writer.rollback()
+    writer.close()
+
+    assert results == [cars] * 16
+    assert 0 < len(repository.read_connections) <= READ_CONNECTIONS
+    assert repository.cursor.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    with pytest.raises(ValueError, match="database file"):
+        SQLiteSearchesRepository(":memory:", concurrent=True)
+
+
+@pytest.mark.unit
+def test_should_not_read_a_snapshot_during_a_write_on_the_shared_connection() -> None:
+    repository = SQLiteSearchesRepository(":memory:")
+    now = datetime.datetime.now().replace(microsecond=0)
+    cars = [example_car(f"car{i}", now) for i in range(3)]
+    repository.insert_cars_for_search("search1", "Example", "", cars)
+
+    # Another thread is in the middle of a write.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with repository.write_lock:
+            future = executor.submit(repository.get_cars_for_search, "search1")
+            with pytest.raises(TimeoutError):
+                future.result(timeout=0.1)
+        assert future.result() == cars
+
+
+@pytest.mark.unit
+def test_should_store_attributes_in_a_lookup_table() -> None:
+    repository = SQLiteSearchesRepository(":memory:")
+    now = datetime.datetime.now().replace(microsecond=0)
+    cars = [
+        dataclasses.replace(example_car("car1", now), attributes=["AHK, abnehmbar"]),
+        dataclasses.replace(example_car("car2", now), attributes=[]),
+        dataclasses.replace(
+            example_car("car3", now), attributes=["sedan", "automatic", "sedan"]
+        ),
+    ]
+    repository.insert_cars_for_search("search1", "Example", "", cars)
+    repository.insert_cars_for_search(
+        "search2", "Example", "", [example_car("car4", now)]
+    )
+
+    frame = repository.get_car_frame_for_search("search1")
+    assert frame.to_cars() == cars
+    assert sorted(frame.attribute_names) == ["AHK, abnehmbar", "automatic", "sedan"]
+    assert frame.attribute_mask(["SEDAN"]).tolist() == [False, False, True]
+    assert [
+        car
+        for batch in repository.iter_car_frames_for_search("search1", 2)
+        for car in batch.to_cars()
+    ] == cars
+    assert repository.cursor.execute("SELECT COUNT(*) FROM attributes").fetchone() == (
+        len(frame.attribute_names),
+    )
+
+
+@pytest.mark.unit
+def test_should_read_cars_and_attribute_names_of_the_same_commit(
+    tmp_path: pathlib.Path,
+) -> None:
+    db_path = str(tmp_path / "drivematch.db")
+    repository = SQLiteSearchesRepository(db_path, concurrent=True)
+    now = datetime.datetime.now().replace(microsecond=0)
+    cars = [
+        dataclasses.replace(example_car("car1", now), attributes=["a"]),
+        dataclasses.replace(example_car("car2", now), attributes=["b"]),
+    ]
+    repository.insert_cars_for_search("search1", "Example", "", cars)
+    relisted_car = dataclasses.replace(
+        cars[0], timestamp=now + datetime.timedelta(seconds=1), attributes=["x", "y"]
+    )
+    repository.get_searches()
+    [reader] = repository.read_connections
+
+    # Another process re-lists a car with new attributes between the queries
+    # for cars and attribute names.
+    def relist(statement: str) -> None:
+        if statement.lstrip().startswith("SELECT id, name FROM attributes"):
+            reader.set_trace_callback(None)
+            SQLiteSearchesRepository(db_path).insert_cars_for_search(
+                "search2", "Example", "", [relisted_car]
+            )
+
+    reader.set_trace_callback(relist)
+    assert repository.get_cars_for_search("search1") == cars
+    assert repository.get_cars_for_search("search1") == [
+        cars[0],
+        relisted_car,
+        cars[1],
+    ]
+
+
+@pytest.mark.unit
+def test_should_stream_cars_and_attribute_names_of_the_same_commit(
+    tmp_path: pathlib.Path,
+) -> None:
+    db_path = str(tmp_path / "drivematch.db")
+    repository = SQLiteSearchesRepository(db_path, concurrent=True)
+    now = datetime.datetime.now().replace(microsecond=0)
+    cars = [dataclasses.replace(example_car("car1", now), attributes=["a"])]
+    repository.insert_cars_for_search("search1", "Example", "", cars)
+    relisted_car = dataclasses.replace(
+        cars[0], timestamp=now + datetime.timedelta(seconds=1), attributes=["new"]
+    )
+    repository.get_searches()
+    [reader] = repository.read_connections
+
+    # Another process re-lists the car with a new attribute right before the
+    # cars are read.
+    def relist(statement: str) -> None:
+        if statement.lstrip().startswith("SELECT cars.id"):
+            reader.set_trace_callback(None)
+            SQLiteSearchesRepository(db_path).insert_cars_for_search(
+                "search2", "Example", "", [relisted_car]
+            )
+
+    reader.set_trace_callback(relist)
+    assert [
+        car
+        for batch in repository.iter_car_frames_for_search("search1")
+        for car in batch.to_cars()
+    ] == [cars[0], relisted_car]
@@ -0,0 +1,186 @@
+import datetime
+
+import numpy as np
+import pytest
+import scipy.optimize
+
+from drivematch._internal import regression
+from drivematch.types import RegressionFunctionType
+
+
+@pytest.fixture
+def depreciation_data() -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(3)
+    x_data = rng.uniform(0.5, 15, size=2000)
+    y_data = 60000 * np.exp(-0.12 * x_data) + rng.normal(0, 2000, size=2000)
+    return x_data, y_data
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "function_type",
+    [
+        function_type
+        for function_type in RegressionFunctionType
+        if regression.is_linear_in_parameters(function_type)
+    ],
+)
+def test_should_solve_linear_models_like_curve_fit(
+    function_type: RegressionFunctionType,
+    depreciation_data: tuple[np.ndarray, np.ndarray],
+) -> None:
+    x_data, y_data = depreciation_data
+
+    params = regression.fit(function_type, x_data, y_data)
+    expected, _ = scipy.optimize.curve_fit(function_type.function, x_data, y_data)
+
+    np.testing.assert_allclose(
+        function_type.function(x_data, *params),
+        function_type.function(x_data, *expected),
+        rtol=1e-6,
+    )
+
+
+@pytest.mark.unit
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.parametrize(
+    "function_type",
+    [
+        RegressionFunctionType.EXPONENTIAL,
+        RegressionFunctionType.POWER_LAW,
+        RegressionFunctionType.LOGARITHMIC,
+    ],
+)
+def test_should_fit_non_linear_models_at_least_as_well_as_unseeded_curve_fit(
+    function_type: RegressionFunctionType,
+    depreciation_data: tuple[np.ndarray, np.ndarray],
+) -> None:
+    x_data, y_data = depreciation_data
+
+    params = regression.fit(function_type, x_data, y_data)
+    unseeded, _ = scipy.optimize.curve_fit(function_type.function, x_data, y_data)
+
+    def rss(p: np.ndarray) -> float:
+        return float(np.sum((function_type.function(x_data, *p) - y_data) ** 2))
+
+    assert rss(params) <= rss(unseeded) * (1 + 1e-6)
+
+
+@pytest.mark.unit
+def test_should_generate_curve_dates_like_timedeltas() -> None:
+    now = datetime.datetime(2025, 6, 1, 12, 30)
+    dates, prices = regression.evaluate_curve(
+        RegressionFunctionType.LINEAR, np.array([50000.0, 2000.0]), 1.0, 10.0, now=now
+    )
+
+    x_curve = np.linspace(1.0, 10.0, 500)
+    expected = [now - datetime.timedelta(days=x * 365.25) for x in x_curve]
+    assert all(
+        abs(date - expected_date) <= datetime.timedelta(microseconds=1)
+        for date, expected_date in zip(dates, expected, strict=True)
+    )
+    np.testing.assert_allclose(prices, 50000.0 - 2000.0 * x_curve)
+
+
+@pytest.mark.unit
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+def test_should_fit_all_models_and_mark_the_best(
+    depreciation_data: tuple[np.ndarray, np.ndarray],
+) -> None:
+    x_data, y_data = depreciation_data
+
+    fits = regression.fit_all_models(x_data, y_data, timeout=30.0)
+
+    assert [fit.function_type for fit in fits] == list(RegressionFunctionType)
+    assert all(fit.error is None for fit in fits)
+    best_fits = [fit for fit in fits if fit.best]
+    assert len(best_fits) == 1
+    assert best_fits[0].aic == min(fit.aic for fit in fits)
+    linear_fit = fits[0]
+    assert linear_fit.bic > linear_fit.aic
+    assert linear_fit.params == pytest.approx(
+        regression.fit(RegressionFunctionType.LINEAR, x_data, y_data).tolist()
+    )
+
+
+@pytest.mark.unit
+def test_should_report_models_that_exceed_their_budget(
+    depreciation_data: tuple[np.ndarray, np.ndarray],
+) -> None:
+    x_data, y_data = depreciation_data
+
+    fits = regression.fit_all_models(x_data, y_data, timeout=0.0)
+
+    assert all("exceeded" in fit.error for fit in fits if fit.error is not None)
+    assert not any(fit.best for fit in fits if fit.error is not None)
+
+
+@pytest.mark.unit
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.filterwarnings("ignore::scipy.optimize.OptimizeWarning")
+@pytest.mark.parametrize(
+    "function_type",
+    [
+        RegressionFunctionType.POLYNOMIAL_4,
+        RegressionFunctionType.LINEAR,
+        RegressionFunctionType.EXPONENTIAL,
+    ],
+)
+def test_should_fit_each_group_like_a_separate_fit(
+    function_type: RegressionFunctionType,
+    depreciation_data: tuple[np.ndarray, np.ndarray],
+) -> None:
+    x_data, y_data = depreciation_data
+    group_codes = np.arange(len(x_data)) % 7
+    group_codes[:3] = 7
+
+    group_params = regression.fit_groups(
+        function_type, group_codes, x_data, y_data, min_group_size=5
+    )
+
+    assert sorted(group_params) == list(range(7))
+    for group, params in group_params.items():
+        in_group = group_codes == group
+        expected = regression.fit(function_type, x_data[in_group], y_data[in_group])
+        np.testing.assert_allclose(
+            function_type.function(x_data[in_group], *params),
+            function_type.function(x_data[in_group], *expected),
+            rtol=1e-6,
+        )
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "function_type",
+    [RegressionFunctionType.POLYNOMIAL_2, RegressionFunctionType.LOGARITHMIC],
+)
+def test_should_fit_daily_bins_like_all_points(
+    function_type: RegressionFunctionType,
+) -> None:
+    rng = np.random.default_rng(5)
+    age_days = rng.integers(30, 5000, size=5000)
+    x_data = age_days / regression.DAYS_PER_YEAR
+    y_data = 60000 - 3000 * x_data + rng.normal(0, 2000, size=5000)
+
+    x_means, y_means, counts = regression.bin_means(age_days, x_data, y_data)
+    assert counts.sum() == len(x_data)
+    assert len(counts) < len(x_data)
+
+    np.testing.assert_allclose(
+        regression.fit(function_type, x_means, y_means, counts),
+        regression.fit(function_type, x_data, y_data),
+        rtol=1e-6,
+    )
+
+
+@pytest.mark.unit
+def test_should_compute_robust_z_scores() -> None:
+    values = np.array([10.0, 12.0, 11.0, 9.0, 10.0, 1000.0, 11.0])
+    median = np.median(values)
+    mad = np.median(np.abs(values - median))
+
+    z_scores = regression.robust_z_scores(values)
+
+    np.testing.assert_allclose(z_scores, (values - median) / (1.4826 * mad))
+    constant = regression.robust_z_scores(np.array([5.0, 5.0, 5.0, 7.0]))
+    assert constant.tolist() == [0.0, 0.0, 0.0, 0.0]
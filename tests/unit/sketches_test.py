@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from drivematch._internal.sketches import QuantileSketch
+
+PROBABILITIES = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+
+def rank_errors(values: np.ndarray, sketch: QuantileSketch) -> np.ndarray:
+    estimates = np.array(sketch.quantiles(PROBABILITIES))
+    ranks = np.searchsorted(np.sort(values), estimates, side="right") / len(values)
+    return np.abs(ranks - PROBABILITIES)
+
+
+@pytest.mark.unit
+def test_should_be_exact_while_values_fit_into_the_sketch() -> None:
+    values = np.random.default_rng(1).integers(0, 1000, size=150)
+    sketch = QuantileSketch()
+    sketch.add(values)
+
+    exact = np.percentile(values, np.array(PROBABILITIES) * 100, method="inverted_cdf")
+    assert sketch.quantiles(PROBABILITIES) == exact.tolist()
+
+
+@pytest.mark.unit
+def test_should_estimate_quantiles_within_rank_error_bound() -> None:
+    values = np.random.default_rng(2).lognormal(10, 0.6, size=300_000)
+    sketch = QuantileSketch()
+    for batch in np.array_split(values, 40):
+        sketch.add(batch)
+
+    assert sketch.count == len(values)
+    assert sum(len(items) for items in sketch.levels) < 1000
+    bound = 2 * 2 / sketch.k
+    assert rank_errors(values, sketch).max() < bound
+    # Every estimate lies between the exact percentiles at q -/+ the bound.
+    estimates = np.array(sketch.quantiles(PROBABILITIES))
+    lower = np.clip(np.array(PROBABILITIES) - bound, 0, 1)
+    upper = np.clip(np.array(PROBABILITIES) + bound, 0, 1)
+    assert np.all(estimates >= np.percentile(values, 100 * lower))
+    assert np.all(estimates <= np.percentile(values, 100 * upper))
+
+
+@pytest.mark.unit
+def test_should_merge_sketches_and_survive_serialization() -> None:
+    rng = np.random.default_rng(3)
+    parts = [rng.normal(loc, 1, size=50_000) for loc in (0, 2, 5)]
+    merged = QuantileSketch()
+    for seed, part in enumerate(parts):
+        sketch = QuantileSketch(seed=seed)
+        sketch.add(part)
+        merged.merge(QuantileSketch.from_json(sketch.to_json()))
+
+    assert merged.count == sum(len(part) for part in parts)
+    assert rank_errors(np.concatenate(parts), merged).max() < 2 * 2 / merged.k